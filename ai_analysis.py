@@ -1,169 +1,345 @@
 import os
+import sys
 import json
+import logging
+import atexit
+import time
 import asyncio
-from typing import Dict, List, Any, Optional
-from datetime import datetime
-import pandas as pd
+import random
+import hashlib
+import importlib.util
+import functools
+import threading
+from collections import OrderedDict
+import httpx
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Final, List, Any, Optional, Tuple
+from datetime import date, datetime
 from pathlib import Path
 
-# Load environment variables
-from dotenv import load_dotenv
-load_dotenv()
+# Load environment variables (once per process, even if the module is reloaded)
+if not os.environ.get("_CAT_DOTENV_LOADED"):
+    from dotenv import load_dotenv
+    load_dotenv()
+    os.environ["_CAT_DOTENV_LOADED"] = "1"
+
+log = logging.getLogger(__name__)
+
+def _console(message: str):
+    """Setup guidance for people running the app in a terminal; kept out of server logs"""
+    if sys.stdout.isatty():
+        print(message)
 
 # Define data directory
 DATA_DIR = Path(__file__).parent / "data"
+QUESTION_COUNTS_CACHE = DATA_DIR / ".question_counts.json"
+
+CAT_EXAM_DATE = datetime(2025, 11, 30)
+_DATE_CACHE: Dict[date, Tuple[str, int]] = {}
+
+def _today_ctx() -> Tuple[str, int]:
+    """(formatted current date, days until the exam), computed once per calendar day"""
+    today = date.today()
+    hit = _DATE_CACHE.get(today)
+    if hit:
+        return hit
+    now = datetime.now()
+    res = (now.strftime("%B %d, %Y"), (CAT_EXAM_DATE - now).days)
+    _DATE_CACHE.clear()
+    _DATE_CACHE[today] = res
+    return res
+
+# Sections in exam order with their default max marks (3 per question)
+SECTION_META = (('VARC', 72), ('DILR', 60), ('QA', 66))
+SECTION_ORDER = tuple(section for section, _ in SECTION_META)
+DEFAULT_MAX_MARKS = dict(SECTION_META)
+DEFAULT_QUESTION_COUNTS = {section: marks // 3 for section, marks in SECTION_META}
+DEFAULT_TOTAL_MAX_MARKS = sum(DEFAULT_MAX_MARKS.values())
+_DEFAULT_PCT_SCALE = {**{section: 100.0 / marks for section, marks in SECTION_META}, "total": 100.0 / DEFAULT_TOTAL_MAX_MARKS}
+_EMPTY: Dict[str, Any] = {}
+
+# LangChain is imported lazily where it is used; it is by far the slowest import here
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
 
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 
 
+# The openai SDK takes about half a second to import; it is loaded on first use
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+
 try:
-    import openai
-    OPENAI_AVAILABLE = True
+    import orjson
+    ORJSON_AVAILABLE = True
 except ImportError:
-    OPENAI_AVAILABLE = False
+    ORJSON_AVAILABLE = False
 
-class CATAnalysisAI:    
-    def __init__(self):
-        self.llm = None
-        self.initialize_llm()
-        self.test_data = None
-        self.question_counts = None
-        self.load_test_data()
-        
-    def initialize_llm(self):
-        openai_api_key = os.getenv('OPENAI_API_KEY')
-        
-        if openai_api_key:
-            try:
-                self.llm = ChatOpenAI()
-                print("OpenAI API initialized successfully")
-            except Exception as e:
-                print(f"OpenAI API initialization failed: {e}")
-                self.try_local_llm()
-        else:
-            print("No OpenAI API key found in environment")
-            print("To enable AI features:")
-            print("   1. Add OPENAI_API_KEY=sk-your-key to .env file")
-            print("   2. Or use local LLM with LM Studio")
-            self.try_local_llm()
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  (enables httpx HTTP/2 support)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# ijson is not a dependency. If it is installed separately, data files larger than
+# this (or any file when orjson is missing) are stream-parsed instead of loaded whole
+STREAM_PARSE_THRESHOLD = 64 * 1024 * 1024
+
+__all__ = [
+    "CATAnalysisAI",
+    "ai_analyzer",
+    "analyze_user_performance",
+    "analyze_user_performance_many",
+    "analyze_user_performance_stream",
+    "analyze_user_performance_batch",
+    "get_question_hint",
+    "get_question_hints_many",
+    "is_ai_available",
+    "probe_llm",
+]
+
+# Shared HTTP pool for every LLM client; the httpx defaults cap concurrency well below what we allow.
+# With h2 installed, concurrent requests to the same host multiplex over one HTTP/2 connection.
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=256, max_keepalive_connections=128, keepalive_expiry=60)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+# Model for the short hint responses (OpenAI only); CAT_ANALYSIS_MODEL overrides the analysis model
+HINT_MODEL = os.getenv('CAT_HINT_MODEL', 'gpt-4o-mini')
+
+# Bound in-flight LLM calls so bursts don't exhaust the HTTP pool or the provider's rate limit
+_LLM_SEM = asyncio.Semaphore(int(os.getenv('CAT_LLM_CONCURRENCY', '8')))
+# Marks the end of a buffered LLM stream (see stream_chain)
+_STREAM_END = object()
+LLM_MAX_ATTEMPTS = 3
+
+# Wall-clock bound per LLM call (per chunk gap when streaming); a stalled call falls back instead of hanging
+LLM_REQUEST_TIMEOUT = float(os.getenv('CAT_LLM_TIMEOUT', '30'))
+# After this many consecutive failed calls, skip the LLM for CIRCUIT_OPEN_SECONDS
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_OPEN_SECONDS = 60
+
+def _is_retryable_llm_error(exc: BaseException) -> bool:
+    """Retry only on rate limiting (429) and server-side (5xx) errors"""
+    if not OPENAI_AVAILABLE:
+        return False
+    import openai
+    if isinstance(exc, openai.RateLimitError):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+# OpenAI Batch API settings for offline, non-interactive analysis runs
+BATCH_POLL_INTERVAL = int(os.getenv('CAT_BATCH_POLL_INTERVAL', '30'))
+BATCH_COMPLETION_WINDOW = "24h"
+
+# Exact-match cache for LLM responses: identical inputs within the TTL reuse the earlier answer
+RESPONSE_CACHE_TTL = int(os.getenv('CAT_RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_MAX_ENTRIES = 256
+
+HINT_ERROR_MESSAGE = "Oops! SAI's having a moment. Try checking the solution or come back in a bit! 😅"
+
+# Token budget for the per-student block of the analysis prompt
+MAX_USER_DATA_TOKENS = int(os.getenv('CAT_MAX_USER_DATA_TOKENS', '1500'))
+
+# Rough size of a token for English text; an estimate keeps the budget check
+# free of a tokenizer dependency and its first-use BPE download
+CHARS_PER_TOKEN = 4
+
+def _estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+# Appended when optional blocks were dropped to fit MAX_USER_DATA_TOKENS
+TRUNCATED_NOTE = "\n(truncated: lower-priority detail omitted to fit the prompt budget)"
+
+def _fit_token_budget(blocks: List[str], optional: Dict[int, int], budget: int = MAX_USER_DATA_TOKENS) -> str:
+    """Join the blocks, dropping whole optional ones until the estimate fits the budget.
     
-    def load_test_data(self):
-        """Load test data and calculate question counts per section"""
-        try:
-            with open(DATA_DIR / "full_data.json", "r", encoding="utf-8") as f:
-                self.test_data = json.load(f)
-            
-            # Calculate question counts for each test
-            self.question_counts = {}
-            for test in self.test_data:
-                test_name = test["name"]
-                varc_count = sum(len(q["qa_list"]) for q in test["data"]["VARC"])
-                dilr_count = sum(len(q["qa_list"]) for q in test["data"]["DILR"])
-                qa_count = sum(len(q["qa_list"]) for q in test["data"]["QA"])
-                
-                self.question_counts[test_name] = {
-                    'VARC': varc_count,
-                    'DILR': dilr_count,
-                    'QA': qa_count
-                }
-            
-            print(f"Loaded test data with {len(self.test_data)} tests")
-        except Exception as e:
-            print(f"Failed to load test data: {e}")
-            # Fallback to hardcoded values if data loading fails
-            self.question_counts = {
-                'default': {'VARC': 72, 'DILR': 60, 'QA': 66}
-            }
+    ``optional`` maps block indexes to drop order (lowest goes first); the
+    remaining blocks are never cut, so the result can still exceed the budget.
+    """
+    sizes = [_estimate_tokens(block) + 1 for block in blocks]  # + the joining newline
+    total = sum(sizes)
+    if total <= budget:
+        return "\n".join(blocks)
+    total += _estimate_tokens(TRUNCATED_NOTE)
+    dropped = set()
+    for i in sorted(optional, key=optional.get):
+        if total <= budget:
+            break
+        dropped.add(i)
+        total -= sizes[i]
+    if not dropped:
+        return "\n".join(blocks)
+    return "\n".join(block for i, block in enumerate(blocks) if i not in dropped) + TRUNCATED_NOTE
+
+# format_user_data results kept per canonical input digest
+FORMAT_CACHE_MAX_ENTRIES = 128
+
+# Above this many answers, format_user_data runs in a worker thread
+FORMAT_IN_THREAD_MIN_ANSWERS = 200
+# Above this many answers (e.g. a whole test-series history), correct answers are counted with numpy
+NUMPY_COUNT_MIN_ANSWERS = 1000
+
+def _cache_key(*parts: Any) -> bytes:
+    """Hash the canonical JSON form of the inputs into a 16-byte key"""
+    if ORJSON_AVAILABLE:
+        payload = orjson.dumps(
+            parts,
+            default=str,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+    else:
+        payload = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+def _mmss(seconds: float) -> str:
+    """Format a duration as "Xm Ys", or "N/A" when there is none"""
+    if seconds <= 0:
+        return "N/A"
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes}m {secs}s"
+
+def _section_percentages(score_items, scale: Dict[str, float]) -> Dict[str, float]:
+    """Percentages for known sections, multiplying by precomputed 100/max-marks factors"""
+    return {
+        section: score * scale[section]
+        for section, score in score_items
+        if section in scale and section != "total"
+    }
+
+@functools.lru_cache(maxsize=512)
+def _classify_scores(scores: Tuple[Tuple[str, int], ...], scale: Tuple[Tuple[str, float], ...]) -> Tuple[str, str]:
+    """Build the strengths and weaknesses bullet lists from one percentage pass"""
+    if not scores:
+        return ("- Complete more questions to identify strengths",
+                "- Complete more questions for detailed analysis")
     
-    def get_question_counts(self, test_name: str = None) -> Dict[str, int]:
-        """Get question counts for a specific test or default values"""
-        if test_name and test_name in self.question_counts:
-            return self.question_counts[test_name]
-        elif self.question_counts:
-            # Return the first available test's counts as default
-            return list(self.question_counts.values())[0]
-        else:
-            # Ultimate fallback
-            return {'VARC': 72, 'DILR': 60, 'QA': 66}
+    percentages = _section_percentages(scores, dict(scale))
+    if not percentages:
+        return ("- Complete the test to identify strengths",
+                "- Complete the test for detailed analysis")
     
-    def try_local_llm(self):
-        """Try to connect to local LLM (LM Studio compatible)"""
-        local_base_url = os.getenv('LOCAL_LLM_BASE_URL', 'http://localhost:1234/v1')
-        local_model = os.getenv('LOCAL_LLM_MODEL', 'local-model')
-        
-        try:
-            # Try local LLM endpoint (LM Studio default)
-            self.llm = ChatOpenAI(
-                temperature=0.3,
-                model=local_model,
-                openai_api_base=local_base_url,
-                openai_api_key="not-needed"
-            )
-            print(f"Local LLM initialized successfully at {local_base_url}")
-            print("Using local LLM - no API costs!")
-        except Exception as e:
-            print(f"Local LLM initialization failed: {e}")
-            print("To use local LLM:")
-            print("   1. Install LM Studio from https://lmstudio.ai/")
-            print("   2. Download a model and start the server")
-            print("   3. Ensure it's running on http://localhost:1234")
-            print("AI features will be disabled - app will use basic analysis")
-            self.llm = None
+    best_section = max(percentages, key=percentages.get)
+    best_score = percentages[best_section]
     
-    def is_available(self) -> bool:
-        return self.llm is not None
+    strengths = [f"- Strong performance in {best_section} ({best_score:.1f}%)"] if best_score > 60 else []
+    weaknesses = []
+    for section, score in percentages.items():
+        if score > 50 and section != best_section:
+            strengths.append(f"- Good grasp of {section} concepts")
+        if score < 40:
+            weaknesses.append(f"- {section} needs significant improvement ({score:.1f}%)")
+        elif score < 60:
+            weaknesses.append(f"- {section} has room for improvement ({score:.1f}%)")
     
-    async def analyze_performance(self, user_data: Dict[str, Any], test_name: str = None) -> Dict[str, Any]:
-        if not self.is_available():
-            return self.generate_fallback_analysis(user_data, test_name)
-        
+    return (
+        "\n".join(strengths) if strengths else "- Focus on building foundational concepts",
+        "\n".join(weaknesses) if weaknesses else "- Overall solid performance, focus on fine-tuning"
+    )
+
+# Opt-in semantic cache: near-identical student profiles reuse an earlier analysis
+SEMANTIC_CACHE_ENABLED = os.getenv('CAT_SEMANTIC_CACHE', '0') == '1'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('CAT_SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_PATH = Path.home() / ".cache" / "cat_mock" / "analysis_cache.jsonl"
+SEMANTIC_CACHE_MAX_PER_BUCKET = 64
+
+class SemanticAnalysisCache:
+    """Embedding-similarity cache for analyses, pre-filtered by student and coarse scores.
+    
+    Entries live in buckets keyed by student, test and section scores rounded
+    down to multiples of 3 (one question's worth of marks). An analysis names
+    its student, so it is never shared between students; within a bucket the
+    closest stored embedding wins if its cosine similarity clears the threshold,
+    so a re-request after a few more answers or seconds reuses the report.
+    
+    Entries are appended to a JSON Lines file on a worker thread; the file is
+    compacted on load once it holds more than twice the live entries.
+    """
+    
+    def __init__(self, path: Path = SEMANTIC_CACHE_PATH, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._buckets: Dict[tuple, List[Tuple[Any, str]]] = {}
+        self._write_lock = threading.Lock()
         try:
-            analysis_prompt = self.create_analysis_prompt()
-            
-            formatted_data = self.format_user_data(user_data, test_name)
-            
-            current_date = datetime.now().strftime("%B %d, %Y")
-            cat_exam_date = datetime(2025, 11, 30)
-            days_remaining = (cat_exam_date - datetime.now()).days
-            
-            chain = analysis_prompt | self.llm | StrOutputParser()
-            analysis_result = await chain.ainvoke({
-                # "user_data": formatted_data,
-                "user_data": "Aswathi",
-                "current_date": current_date,
-                "days_remaining": days_remaining
-            })
-            
-            return {
-                "status": "success",
-                "analysis": analysis_result,
-                "generated_at": datetime.now().isoformat(),
-                "source": "ai_generated"
-            }
-            
-        except Exception as e:
-            print(f"Error in AI analysis: {e}")
-            return self.generate_fallback_analysis(user_data, test_name)
+            self._load()
+        except OSError:
+            pass
+    
+    def _load(self):
+        import numpy as np
+        lines = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                    bucket = tuple(entry["key"])
+                    vector = np.asarray(entry["vector"], dtype=np.float32)
+                    analysis = entry["analysis"]
+                except (ValueError, KeyError, TypeError):
+                    continue  # e.g. a line cut short by a crash
+                entries = self._buckets.setdefault(bucket, [])
+                entries.append((vector, analysis))
+                del entries[:-SEMANTIC_CACHE_MAX_PER_BUCKET]
+        if lines > 2 * sum(len(entries) for entries in self._buckets.values()):
+            self._rewrite()
+    
+    @staticmethod
+    def _entry_line(bucket: tuple, vector, analysis: str) -> str:
+        return json.dumps({"key": list(bucket), "vector": vector.tolist(), "analysis": analysis}) + "\n"
+    
+    def _rewrite(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for bucket, entries in self._buckets.items():
+                f.writelines(self._entry_line(bucket, vector, analysis) for vector, analysis in entries)
+        os.replace(tmp_path, self.path)
+    
+    @staticmethod
+    def bucket_key(test_name: Optional[str], user_data: Dict[str, Any]) -> tuple:
+        section_scores = user_data.get('section_scores', {})
+        return (user_data.get('username'), test_name) + tuple(
+            int(section_scores.get(section, 0)) // 3 for section in SECTION_ORDER
+        )
     
-    def create_analysis_prompt(self) -> ChatPromptTemplate:
-        prompt_template = """
+    def lookup(self, bucket: tuple, vector) -> Optional[str]:
+        import numpy as np
+        entries = self._buckets.get(bucket)
+        if not entries:
+            return None
+        similarities = np.stack([v for v, _ in entries]) @ vector
+        best = int(similarities.argmax())
+        return entries[best][1] if similarities[best] >= self.threshold else None
+    
+    def add(self, bucket: tuple, vector, analysis: str):
+        """Store an analysis and append it to the cache file in the background"""
+        entries = self._buckets.setdefault(bucket, [])
+        entries.append((vector, analysis))
+        del entries[:-SEMANTIC_CACHE_MAX_PER_BUCKET]
+        asyncio.get_running_loop().run_in_executor(None, self._append, self._entry_line(bucket, vector, analysis))
+    
+    def _append(self, line: str):
+        with self._write_lock:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                log.warning("Could not persist semantic cache: %s", e)
+
+# Prompt templates. Static instructions go first as the system message so
+# providers with automatic prefix caching (OpenAI, >=1024 tokens) can reuse
+# them across requests; only the short human message changes per student.
+_ANALYSIS_SYSTEM_TEMPLATE: Final[str] = """
         You are StrategyAI (you can call me SAI 😉) - a no-nonsense CAT exam strategist with 10+ years of experience. I cut through the fluff and give you straight-up actionable insights to boost your CAT score.
 
         PERSONALITY: Conversational, direct, and Spartan. Zero corporate jargon. I talk like a friend who genuinely wants you to crush this exam.
 
-        CONTEXT:
-        - Today's Date: {current_date}
-        - CAT Exam Date: November 30, 2025
-        - Days Remaining: {days_remaining}
-
-        Student Data:
-        {user_data}
-
-        Analyze this performance and give me the real deal:
+        For every student performance you receive, give them the real deal using this structure:
 
         ## 🎯 Performance Reality Check
         - Where you stand vs CAT standards (percentile range)
@@ -224,116 +400,81 @@ class CATAnalysisAI:
         - End with "That's the game plan! Now go execute it. 💪"
         - NO email signatures or formal closings
         - Focus on 7-10 day plans, not the entire remaining time (unless they ask for more)
+
+        CAT FACTS (apply to every student):
+        - The data you receive is from a CAT mock test
+        - CAT marking: +3 correct, -1 wrong MCQ, 0 wrong TITA
+        - Target CAT percentile range: 85-99+ (120+ marks)
+        - Section time limit: 40 minutes each
         """
-        
-        return ChatPromptTemplate.from_template(prompt_template)
-    
-    def format_user_data(self, user_data: Dict[str, Any], test_name: str = None) -> str:
-        formatted = []
-        
-        formatted.append(f"📋 Test Details:")
-        formatted.append(f"- Test: {user_data.get('test_name', 'Unknown')}")
-        formatted.append(f"- Date: {user_data.get('date', datetime.now().strftime('%Y-%m-%d'))}")
-        formatted.append(f"- Student: {user_data.get('username', 'Unknown')}")
-        
-        section_scores = user_data.get('section_scores', {})
-        total_score = sum(section_scores.values())
-        
-        # Get dynamic question counts
-        question_counts = self.get_question_counts(test_name)
-        total_max_score = sum(question_counts.values()) * 3
-        
-        formatted.append(f"\n🏆 Overall Performance:")
-        formatted.append(f"- Total Score: {total_score}/{total_max_score} ({total_score/total_max_score*100:.1f}%)")
-        
-        formatted.append(f"\n📊 Section-wise Performance:")
-        performance_insights = user_data.get('performance_insights', {})
-        section_analysis = performance_insights.get('section_analysis', {})
-        
-        for section in ['VARC', 'DILR', 'QA']:
-            max_marks = question_counts[section] * 3
-            section_data = section_analysis.get(section, {})
-            formatted.append(f"\n{section}:")
-            formatted.append(f"  - Score: {section_scores.get(section, 0)}/{max_marks} ({section_scores.get(section, 0)/max_marks*100:.1f}%)")
-            formatted.append(f"  - Questions Attempted: {section_data.get('attempted', 0)}")
-            formatted.append(f"  - Questions Correct: {section_data.get('correct', 0)}")
-            formatted.append(f"  - Section Accuracy: {section_data.get('accuracy', 0):.1f}%")
-            formatted.append(f"  - Time Efficiency: {section_data.get('efficiency', 0):.2f} marks/minute")
-        
-        time_data = user_data.get('time_analysis', {})
-        if time_data:
-            formatted.append(f"\n⏱️ Time Management Analysis:")
-            formatted.append(f"- Total Time Used: {time_data.get('total_time_formatted', 'N/A')}")
-            formatted.append(f"- Average per Question: {time_data.get('avg_per_question_formatted', 'N/A')}")
-            formatted.append(f"- Questions with Time Data: {time_data.get('attempted_count', 0)}")
+
+_ANALYSIS_HUMAN_TEMPLATE: Final[str] = """
+        CONTEXT:
+        - Today's Date: {current_date}
+        - CAT Exam Date: November 30, 2025
+        - Days Remaining: {days_remaining}
+
+        Student Data:
+        {user_data}
+
+        Analyze this performance and give me the real deal.
+        """
+
+_HINT_SYSTEM_TEMPLATE: Final[str] = """
+            You are StrategyAI (call me SAI 😉) - a direct CAT strategist. A student is stuck on a question. Give them a smart hint WITHOUT spoiling the answer.
             
-            section_times = time_data.get('section_times', {})
-            for section in ['VARC', 'DILR', 'QA']:
-                if section in section_times:
-                    sect_time = section_times[section]
-                    avg_time_formatted = f"{int(sect_time['avg_time']//60)}m {int(sect_time['avg_time']%60)}s" if sect_time['avg_time'] > 0 else "N/A"
-                    formatted.append(f"  - {section} Avg Time: {avg_time_formatted} per question")
-        
-        if 'question_type_performance' in performance_insights:
-            qtype_data = performance_insights['question_type_performance']
-            formatted.append(f"\n🎯 Question Type Analysis:")
-            for qtype, data in qtype_data.items():
-                if data['attempted'] > 0:
-                    accuracy = (data['correct'] / data['attempted']) * 100
-                    formatted.append(f"- {qtype}: {data['correct']}/{data['attempted']} ({accuracy:.1f}% accuracy)")
-        
-        formatted.append(f"\n🔍 Performance Patterns:")
-        formatted.append(f"- Overall questions attempted: {time_data.get('attempted_count', 0)}/66")
-        formatted.append(f"- Overall accuracy: {(sum(s.get('correct', 0) for s in section_analysis.values()) / max(sum(s.get('attempted', 1) for s in section_analysis.values()), 1) * 100):.1f}%")
-        
-        formatted.append(f"\n💡 Additional Context:")
-        formatted.append(f"- This is a CAT mock test analysis")
-        formatted.append(f"- CAT marking: +3 correct, -1 wrong MCQ, 0 wrong TITA")
-        formatted.append(f"- Target CAT percentile range: 85-99+ (120+ marks)")
-        formatted.append(f"- Section time limit: 40 minutes each")
-        
-        return "\n".join(formatted)
-    
-    def generate_fallback_analysis(self, user_data: Dict[str, Any], test_name: str = None) -> Dict[str, Any]:
-        section_scores = user_data.get('section_scores', {})
-        total_score = sum(section_scores.values())
-        
-        answers = user_data.get('answers', {})
-        attempted = len(answers)
-        correct = sum(1 for a in answers.values() if a.get('correct', False))
-        accuracy = (correct / attempted * 100) if attempted > 0 else 0
-        
-        current_date = datetime.now().strftime("%B %d, %Y")
-        cat_exam_date = datetime(2025, 11, 30)
-        days_remaining = (cat_exam_date - datetime.now()).days
-        
-        # Get dynamic question counts
-        question_counts = self.get_question_counts(test_name)
-        total_questions = sum(question_counts.values())
-        
-        analysis = f"""
-        Hey there! StrategyAI here (you can call me SAI 😉)
+            Give a strategic nudge:
+            - VARC: Point to key passage clues, logical flow, or elimination strategy
+            - DILR: Suggest the approach, what data to focus on, logical sequence
+            - QA: Hint at the concept/method needed, not the calculation steps
+            
+            Keep it conversational, encouraging, and brief. End with "Give it another shot! 💪"
+            """
+
+_HINT_HUMAN_TEMPLATE: Final[str] = """
+            Question: {question}
+            Question Type: {question_type}
+            Options: {options}
+            """
+
+@functools.lru_cache(maxsize=None)
+def _prompt_templates() -> Tuple["ChatPromptTemplate", "ChatPromptTemplate"]:
+    """(analysis, hint) prompt objects, parsed once per process on first use"""
+    from langchain_core.prompts import ChatPromptTemplate
+    analysis = ChatPromptTemplate.from_messages([
+        ("system", _ANALYSIS_SYSTEM_TEMPLATE),
+        ("human", _ANALYSIS_HUMAN_TEMPLATE)
+    ])
+    hint = ChatPromptTemplate.from_messages([
+        ("system", _HINT_SYSTEM_TEMPLATE),
+        ("human", _HINT_HUMAN_TEMPLATE)
+    ])
+    return analysis, hint
+
+# Programmatic analysis shown when no LLM is available; filled with str.format_map.
+# It starts and ends on content so the rendered text needs no strip().
+_FALLBACK_TEMPLATE: Final[str] = """Hey there! StrategyAI here (you can call me SAI 😉)
         
         I'm running on basic mode right now, but let me give you the essentials:
         
         ## 🎯 Your Performance Reality Check
         
-        **Overall Score:** {total_score}/{total_questions * 3} ({total_score/(total_questions * 3)*100:.1f}%)
+        **Overall Score:** {total_score}/{total_max_score} ({total_pct:.1f}%)
         **Today:** {current_date}
         **CAT Exam:** November 30, 2025 ({days_remaining} days to go!)
         
         **Section Breakdown:**
-        - VARC: {section_scores.get('VARC', 0)}/{question_counts['VARC']} ({section_scores.get('VARC', 0)/question_counts['VARC']*100:.1f}%)
-        - DILR: {section_scores.get('DILR', 0)}/{question_counts['DILR']} ({section_scores.get('DILR', 0)/question_counts['DILR']*100:.1f}%)
-        - QA: {section_scores.get('QA', 0)}/{question_counts['QA']} ({section_scores.get('QA', 0)/question_counts['QA']*100:.1f}%)
+        - VARC: {varc}/{varc_max} ({varc_pct:.1f}%)
+        - DILR: {dilr}/{dilr_max} ({dilr_pct:.1f}%)
+        - QA: {qa}/{qa_max} ({qa_pct:.1f}%)
         
         **Accuracy:** {accuracy:.1f}% ({correct}/{attempted} questions)
         
         ## 🚀 What's Working For You
-        {self.identify_strengths(section_scores, test_name)}
+        {strengths}
         
         ## 🎯 What Needs Your Attention
-        {self.identify_weaknesses(section_scores, test_name)}
+        {weaknesses}
         
         ## Your Next 7 Days Game Plan
         
@@ -351,114 +492,936 @@ class CATAnalysisAI:
         
         That's your basic game plan! For detailed AI insights, set up the OpenAI API key.
         
-        Now go execute it! 💪
+        Now go execute it! 💪"""
+
+class CATAnalysisAI:    
+    def __init__(self):
+        self.llm = None
+        self.llm_small = None
+        self._analysis_prompt = None
+        self._hint_prompt = None
+        self._analysis_chain = None
+        self._hint_chain = None
+        self._chains_llm = None
+        self._response_cache: Dict[bytes, Tuple[float, str]] = {}
+        self._format_cache: "OrderedDict[bytes, str]" = OrderedDict()
+        # format_user_data runs on the loop and in to_thread workers
+        self._format_cache_lock = threading.Lock()
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+        self._http_client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+        self._http_sync_client = httpx.Client(http2=HTTP2_AVAILABLE, limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+        atexit.register(self.close_http_clients)
+        self._prewarm_task = None
+        self._fail_count = 0
+        self._cb_open_until = 0.0
+        self._embeddings = None
+        self._semantic_cache = None
+        self.initialize_llm()
+        self.question_counts = None
+        self._max_marks = {}
+        self._total_max = {}
+        self._pct_scale = {}
+        self.load_test_data()
+        
+    def initialize_llm(self):
+        openai_api_key = os.getenv('OPENAI_API_KEY')
+        
+        if openai_api_key:
+            try:
+                from langchain_openai import ChatOpenAI
+                client_kwargs = {
+                    "streaming": True,
+                    "request_timeout": LLM_REQUEST_TIMEOUT,
+                    "max_retries": 0,
+                    "http_client": self._http_sync_client,
+                    "http_async_client": self._http_client
+                }
+                analysis_model = os.getenv('CAT_ANALYSIS_MODEL')
+                self.llm = ChatOpenAI(**({"model": analysis_model} if analysis_model else {}), **client_kwargs)
+                # Hints are short; a smaller model answers them faster and cheaper
+                self.llm_small = ChatOpenAI(model=HINT_MODEL, temperature=0.3, **client_kwargs)
+                log.info("OpenAI API initialized successfully")
+            except Exception as e:
+                log.warning("OpenAI API initialization failed: %s", e)
+                self.try_local_llm()
+        else:
+            log.info("No OpenAI API key found in environment")
+            _console("To enable AI features:")
+            _console("   1. Add OPENAI_API_KEY=sk-your-key to .env file")
+            _console("   2. Or use local LLM with LM Studio")
+            self.try_local_llm()
+        
+        self.build_chains()
+        self.schedule_prewarm()
+        self.initialize_semantic_cache()
+    
+    def initialize_semantic_cache(self):
+        """Enable the semantic cache when requested and OpenAI embeddings are usable"""
+        if not (SEMANTIC_CACHE_ENABLED and os.getenv('OPENAI_API_KEY') and self.llm is not None):
+            return
+        try:
+            from langchain_openai import OpenAIEmbeddings
+            self._embeddings = OpenAIEmbeddings(http_async_client=self._http_client)
+            self._semantic_cache = SemanticAnalysisCache()
+        except Exception as e:
+            log.warning("Semantic cache disabled: %s", e)
+            self._embeddings = None
+            self._semantic_cache = None
+    
+    async def embed_for_cache(self, formatted_data: str):
+        """Unit-length embedding of the formatted student data, or None if unavailable"""
+        if self._semantic_cache is None:
+            return None
+        import numpy as np
+        try:
+            vector = np.asarray(await self._embeddings.aembed_query(formatted_data), dtype=np.float32)
+        except Exception as e:
+            log.warning("Embedding for semantic cache failed: %s", e)
+            return None
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+    
+    def close_http_clients(self):
+        """Close the pooled connections (registered with atexit)"""
+        self._http_sync_client.close()
+        if self._http_client.is_closed:
+            return
+        try:
+            asyncio.run(self._http_client.aclose())
+        except Exception:
+            # Interpreter shutdown: sockets are released with the process anyway
+            pass
+    
+    def schedule_prewarm(self):
+        """Open the HTTPS connection in the background so the first analysis skips the handshake"""
+        if self.llm is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Constructed outside an event loop (e.g. at import time); the first call warms the pool
+            return
+        self._prewarm_task = loop.create_task(self.prewarm_connection())
+    
+    async def prewarm_connection(self):
+        """Issue a cheap GET /models through the shared pool; failures are ignored"""
+        await self.probe_llm(timeout=LLM_REQUEST_TIMEOUT)
+    
+    def build_chains(self):
+        """Compile the analysis and hint chains once for the current LLMs"""
+        self._chains_llm = (self.llm, self.llm_small)
+        if self.llm is None:
+            self._analysis_chain = None
+            self._hint_chain = None
+            return
+        
+        from langchain_core.output_parsers import StrOutputParser
+        self._analysis_prompt = self.create_analysis_prompt()
+        self._hint_prompt = self.create_hint_prompt()
+        self._analysis_chain = self._analysis_prompt | self.llm | StrOutputParser()
+        self._hint_chain = self._hint_prompt | self.hint_llm | StrOutputParser()
+    
+    @property
+    def hint_llm(self):
+        """Model used for hints: the small model when configured, else the main one"""
+        return self.llm_small if self.llm_small is not None else self.llm
+    
+    def chains_current(self) -> bool:
+        """Rebuild the compiled chains if self.llm or self.llm_small was swapped since they were built"""
+        built = self._chains_llm
+        if built is None or built[0] is not self.llm or built[1] is not self.llm_small:
+            self.build_chains()
+        return self._analysis_chain is not None
+    
+    @property
+    def analysis_prompt(self):
+        self.chains_current()
+        return self._analysis_prompt
+    
+    @property
+    def analysis_chain(self):
+        self.chains_current()
+        return self._analysis_chain
+    
+    @property
+    def hint_chain(self):
+        self.chains_current()
+        return self._hint_chain
+    
+    @property
+    def hint_prompt(self):
+        self.chains_current()
+        return self._hint_prompt
+    
+    def completion_request(self, prompt, inputs: Dict[str, Any], llm=None) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """(AsyncOpenAI client, chat.completions kwargs) for calling the API directly.
+        
+        LangChain still renders the prompt, but the request skips the Runnable,
+        callback and parser layers. Returns None when the LLM is not an OpenAI
+        compatible client, in which case callers go through the chain.
+        """
+        llm = llm if llm is not None else self.llm
+        client = getattr(llm, "root_async_client", None)
+        if client is None or prompt is None:
+            return None
+        from langchain_core.messages import convert_to_openai_messages
+        params = {
+            "model": llm.model_name,
+            "messages": convert_to_openai_messages(prompt.format_messages(**inputs))
+        }
+        if llm.temperature is not None:
+            params["temperature"] = llm.temperature
+        return client, params
+    
+    def load_test_data(self):
+        """Calculate question counts per section, reusing the on-disk cache when fresh"""
+        data_file = DATA_DIR / "full_data.json"
+        try:
+            mtime_ns = data_file.stat().st_mtime_ns
+            self.question_counts = self.read_cached_counts(mtime_ns)
+            
+            if self.question_counts is None:
+                # Only the counts are kept; each test object is dropped once counted
+                self.question_counts = {}
+                for test in self.iter_tests(data_file):
+                    sections = test["data"]
+                    self.question_counts[test["name"]] = {
+                        section: sum(map(len, [q["qa_list"] for q in sections[section]]))
+                        for section in SECTION_ORDER
+                    }
+                self.write_cached_counts(mtime_ns)
+            
+            log.info("Loaded test data with %d tests", len(self.question_counts))
+        except Exception as e:
+            log.warning("Failed to load test data: %s", e)
+            # Fallback to hardcoded values if data loading fails
+            self.question_counts = {
+                'default': dict(DEFAULT_QUESTION_COUNTS)
+            }
+        
+        # Precompute max marks (3 per question) so report code never re-multiplies
+        for test_name, counts in self.question_counts.items():
+            self._max_marks[test_name] = {sect: cnt * 3 for sect, cnt in counts.items()}
+            self._total_max[test_name] = sum(counts.values()) * 3
+            # Reciprocals turn percentage math into a multiply; keyed by section plus "total"
+            self._pct_scale[test_name] = {sect: 100.0 / max(marks, 1) for sect, marks in self._max_marks[test_name].items()}
+            self._pct_scale[test_name]["total"] = 100.0 / max(self._total_max[test_name], 1)
+    
+    def iter_tests(self, data_file: Path):
+        """Yield test objects from the data file.
+        
+        Normally the whole file is read and parsed with orjson (json.load without
+        it). Only when the optional ijson package is installed is a file above
+        STREAM_PARSE_THRESHOLD, or any file when orjson is missing, streamed instead.
+        """
+        if IJSON_AVAILABLE and (not ORJSON_AVAILABLE or data_file.stat().st_size > STREAM_PARSE_THRESHOLD):
+            with open(data_file, "rb") as f:
+                yield from ijson.items(f, "item")
+        elif ORJSON_AVAILABLE:
+            yield from orjson.loads(data_file.read_bytes())
+        else:
+            with open(data_file, "r", encoding="utf-8") as f:
+                yield from json.load(f)
+    
+    def read_cached_counts(self, mtime_ns: int) -> Optional[Dict[str, Dict[str, int]]]:
+        """Return cached question counts if they were computed from the current data file"""
+        try:
+            with open(QUESTION_COUNTS_CACHE, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("mtime_ns") == mtime_ns:
+                return cached["question_counts"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+    
+    def write_cached_counts(self, mtime_ns: int):
+        """Persist question counts next to the data file, keyed by its mtime"""
+        try:
+            with open(QUESTION_COUNTS_CACHE, "w", encoding="utf-8") as f:
+                json.dump({"mtime_ns": mtime_ns, "question_counts": self.question_counts}, f)
+        except OSError as e:
+            log.warning("Could not cache question counts: %s", e)
+    
+    def resolve_test_name(self, test_name: str = None) -> Optional[str]:
+        """Map a test name to a known test, defaulting to the first available one"""
+        if test_name and test_name in self.question_counts:
+            return test_name
+        elif self.question_counts:
+            # Use the first available test as default
+            return next(iter(self.question_counts))
+        return None
+    
+    def get_question_counts(self, test_name: str = None) -> Dict[str, int]:
+        """Get question counts for a specific test or default values"""
+        key = self.resolve_test_name(test_name)
+        if key is not None:
+            return self.question_counts[key]
+        # Ultimate fallback
+        return dict(DEFAULT_QUESTION_COUNTS)
+    
+    def get_max_marks(self, test_name: str = None) -> Dict[str, int]:
+        """Get max marks per section for a specific test or default values"""
+        key = self.resolve_test_name(test_name)
+        if key is not None:
+            return self._max_marks[key]
+        return dict(DEFAULT_MAX_MARKS)
+    
+    def get_total_max_marks(self, test_name: str = None) -> int:
+        """Get max marks across all sections for a specific test or default value"""
+        key = self.resolve_test_name(test_name)
+        if key is not None:
+            return self._total_max[key]
+        return DEFAULT_TOTAL_MAX_MARKS
+    
+    def get_pct_scale(self, test_name: str = None) -> Dict[str, float]:
+        """100 / max marks per section (and "total"), for turning scores into percentages"""
+        key = self.resolve_test_name(test_name)
+        if key is not None:
+            return self._pct_scale[key]
+        return _DEFAULT_PCT_SCALE
+    
+    def try_local_llm(self):
+        """Try to connect to local LLM (LM Studio compatible)"""
+        local_base_url = os.getenv('LOCAL_LLM_BASE_URL', 'http://localhost:1234/v1')
+        local_model = os.getenv('LOCAL_LLM_MODEL', 'local-model')
+        
+        try:
+            from langchain_openai import ChatOpenAI
+            # Try local LLM endpoint (LM Studio default)
+            self.llm = ChatOpenAI(
+                temperature=0.3,
+                model=local_model,
+                openai_api_base=local_base_url,
+                openai_api_key="not-needed",
+                streaming=True,
+                request_timeout=LLM_REQUEST_TIMEOUT,
+                max_retries=0,
+                http_client=self._http_sync_client,
+                http_async_client=self._http_client
+            )
+            # Local servers usually host a single model, so hints share it
+            self.llm_small = self.llm
+            # Construction does not contact the server; use probe_llm() to check it is reachable
+            log.info("Local LLM configured at %s", local_base_url)
+            _console("Using local LLM - no API costs!")
+        except Exception as e:
+            log.warning("Local LLM initialization failed: %s", e)
+            _console("To use local LLM:")
+            _console("   1. Install LM Studio from https://lmstudio.ai/")
+            _console("   2. Download a model and start the server")
+            _console("   3. Ensure it's running on http://localhost:1234")
+            log.warning("AI features will be disabled - app will use basic analysis")
+            self.llm = None
+            self.llm_small = None
+    
+    def is_available(self) -> bool:
+        return self.llm is not None
+    
+    async def probe_llm(self, timeout: float = 0.5) -> bool:
+        """Check that the configured LLM endpoint answers GET /models within timeout.
+        
+        Only run on request (e.g. a health check): is_available() stays a cheap
+        configuration check and never touches the network.
+        """
+        if self.llm is None:
+            return False
+        base_url = (self.llm.openai_api_base or "https://api.openai.com/v1").rstrip("/")
+        api_key = self.llm.openai_api_key.get_secret_value() if self.llm.openai_api_key else ""
+        try:
+            response = await asyncio.wait_for(
+                self._http_client.get(f"{base_url}/models", headers={"Authorization": f"Bearer {api_key}"}),
+                timeout
+            )
+        except Exception:
+            return False
+        return response.status_code < 500
+    
+    def circuit_open(self) -> bool:
+        """True while recent consecutive LLM failures have tripped the breaker"""
+        return time.monotonic() < self._cb_open_until
+    
+    def record_llm_result(self, ok: bool):
+        """Track consecutive failures, opening the breaker once the threshold is hit"""
+        if ok:
+            self._fail_count = 0
+            return
+        self._fail_count += 1
+        if self._fail_count >= CIRCUIT_FAILURE_THRESHOLD:
+            self._cb_open_until = time.monotonic() + CIRCUIT_OPEN_SECONDS
+            self._fail_count = 0
+            log.warning("LLM failing repeatedly; using fallback responses for %ss", CIRCUIT_OPEN_SECONDS)
+    
+    def get_cached_response(self, key: bytes) -> Optional[str]:
+        """Return a cached response if it is still within the TTL"""
+        entry = self._response_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, response = entry
+        if time.monotonic() - stored_at > RESPONSE_CACHE_TTL:
+            del self._response_cache[key]
+            return None
+        return response
+    
+    def cache_response(self, key: bytes, response: str):
+        """Store a response, evicting the oldest entry once the cache is full"""
+        self._response_cache.pop(key, None)
+        if len(self._response_cache) >= RESPONSE_CACHE_MAX_ENTRIES:
+            del self._response_cache[next(iter(self._response_cache))]
+        self._response_cache[key] = (time.monotonic(), response)
+    
+    async def invoke_chain(self, chain, inputs: Dict[str, Any], prompt=None, llm=None) -> str:
+        """Invoke a chain under the shared concurrency limit, backing off on 429/5xx.
+        
+        Each attempt is bounded by LLM_REQUEST_TIMEOUT. With the chain's prompt
+        given, OpenAI-compatible LLMs are called directly.
+        """
+        request = self.completion_request(prompt, inputs, llm)
+        try:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(LLM_MAX_ATTEMPTS),
+                wait=wait_exponential_jitter(),
+                retry=retry_if_exception(_is_retryable_llm_error),
+                reraise=True
+            ):
+                with attempt:
+                    async with _LLM_SEM:
+                        if request is None:
+                            result = await asyncio.wait_for(chain.ainvoke(inputs), LLM_REQUEST_TIMEOUT)
+                        else:
+                            client, params = request
+                            response = await asyncio.wait_for(client.chat.completions.create(**params), LLM_REQUEST_TIMEOUT)
+                            result = response.choices[0].message.content or ""
+        except Exception:
+            self.record_llm_result(False)
+            raise
+        self.record_llm_result(True)
+        return result
+    
+    async def _raw_stream(self, chain, inputs: Dict[str, Any], request) -> AsyncIterator[str]:
+        if request is None:
+            async for chunk in chain.astream(inputs):
+                yield chunk
+            return
+        client, params = request
+        async for chunk in await client.chat.completions.create(**params, stream=True):
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if content:
+                yield content
+    
+    async def stream_chain(self, chain, inputs: Dict[str, Any], prompt=None) -> AsyncIterator[str]:
+        """Stream a chain's output under the shared concurrency limit.
+        
+        429/5xx errors are retried with jittered backoff as long as no text
+        has arrived yet; once it has, errors propagate.
+        A gap of more than LLM_REQUEST_TIMEOUT between chunks aborts the stream.
+        With the chain's prompt given, OpenAI-compatible LLMs are streamed directly.
+        
+        The upstream stream is read by its own task into a queue, so the
+        concurrency slot is released as soon as the LLM finishes, however
+        slowly the caller consumes the text.
         """
+        queue: "asyncio.Queue" = asyncio.Queue()
+        pump = asyncio.ensure_future(self._pump_chain(chain, inputs, self.completion_request(prompt, inputs), queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            pump.cancel()  # no-op once finished; stops the upstream read if the caller went away
+    
+    async def _pump_chain(self, chain, inputs: Dict[str, Any], request, queue: "asyncio.Queue"):
+        """Read the upstream stream into the queue, ending with _STREAM_END (after an exception on failure)"""
+        try:
+            for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+                received = False
+                stream = self._raw_stream(chain, inputs, request)
+                try:
+                    async with _LLM_SEM:
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(anext(stream), LLM_REQUEST_TIMEOUT)
+                            except StopAsyncIteration:
+                                break
+                            received = True
+                            queue.put_nowait(chunk)
+                    self.record_llm_result(True)
+                    return
+                except Exception as e:
+                    if received or attempt == LLM_MAX_ATTEMPTS or not _is_retryable_llm_error(e):
+                        self.record_llm_result(False)
+                        raise
+                finally:
+                    await stream.aclose()
+                await asyncio.sleep(min(2 ** (attempt - 1), 60) + random.uniform(0, 1))
+        except Exception as e:
+            queue.put_nowait(e)
+        finally:
+            queue.put_nowait(_STREAM_END)
+    
+    async def build_analysis_inputs(self, user_data: Dict[str, Any], test_name: str) -> Dict[str, Any]:
+        """Prompt variables for the analysis chain"""
+        # Large payloads are formatted off the event loop so other requests keep flowing
+        if len(user_data.get('answers', ())) > FORMAT_IN_THREAD_MIN_ANSWERS:
+            formatted_data = await asyncio.to_thread(self.format_user_data, user_data, test_name)
+        else:
+            formatted_data = self.format_user_data(user_data, test_name)
         
+        current_date, days_remaining = _today_ctx()
         return {
-            "status": "success",
-            "analysis": analysis.strip(),
-            "generated_at": datetime.now().isoformat(),
-            "source": "programmatic"
+            "user_data": formatted_data,
+            "current_date": current_date,
+            "days_remaining": days_remaining
         }
     
-    def identify_strengths(self, section_scores: Dict[str, int], test_name: str = None) -> str:
-        if not section_scores:
-            return "- Complete more questions to identify strengths"
+    async def coalesced(self, key: bytes, work) -> str:
+        """Run `work` once per key at a time; concurrent callers with the same key share its result.
         
-        max_sections = self.get_question_counts(test_name)
+        The work runs as its own task and every caller, the first one included,
+        awaits it through asyncio.shield, so a cancelled caller never cancels
+        the shared call for the others.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            work.close()
+        else:
+            task = asyncio.ensure_future(work)
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._finish_inflight, key))
+        return await asyncio.shield(task)
+    
+    def _finish_inflight(self, key: bytes, task: "asyncio.Future") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller was cancelled
+    
+    async def generate_analysis_text(self, user_data: Dict[str, Any], test_name: str = None) -> str:
+        """Produce the analysis markdown from the semantic cache or the LLM"""
+        inputs = await self.build_analysis_inputs(user_data, test_name)
+        bucket = SemanticAnalysisCache.bucket_key(test_name, user_data)
+        vector = await self.embed_for_cache(inputs["user_data"])
+        if vector is not None:
+            similar = self._semantic_cache.lookup(bucket, vector)
+            if similar is not None:
+                return similar
         
-        percentages = {}
-        for section, score in section_scores.items():
-            if section in max_sections:
-                percentages[section] = (score / max_sections[section]) * 100
+        analysis_result = "".join([chunk async for chunk in self.stream_chain(self.analysis_chain, inputs, self.analysis_prompt)])
+        if vector is not None:
+            self._semantic_cache.add(bucket, vector, analysis_result)
+        return analysis_result
+    
+    async def analyze_performance(self, user_data: Dict[str, Any], test_name: str = None) -> Dict[str, Any]:
+        if not self.is_available() or self.circuit_open():
+            return self.generate_fallback_analysis(user_data, test_name)
         
-        if not percentages:
-            return "- Complete the test to identify strengths"
+        try:
+            now = datetime.now()
+            cache_key = _cache_key("analysis", test_name, user_data)
+            analysis_result = self.get_cached_response(cache_key)
+            if analysis_result is None:
+                analysis_result = await self.coalesced(cache_key, self.generate_analysis_text(user_data, test_name))
+                self.cache_response(cache_key, analysis_result)
+            
+            return {
+                "status": "success",
+                "analysis": analysis_result,
+                "generated_at": now.isoformat(),
+                "source": "ai_generated"
+            }
+            
+        except Exception:
+            log.exception("AI analysis failed")
+            return self.generate_fallback_analysis(user_data, test_name)
+    
+    async def analyze_performance_stream(self, user_data: Dict[str, Any], test_name: str = None) -> AsyncIterator[str]:
+        """Yield the analysis markdown as it is generated.
         
-        best_section = max(percentages.keys(), key=lambda k: percentages[k])
-        best_score = percentages[best_section]
+        Cached and programmatic analyses are yielded in one piece. If the LLM
+        fails before producing any text the fallback analysis is yielded instead.
+        """
+        if not self.is_available() or self.circuit_open():
+            yield self.generate_fallback_analysis(user_data, test_name)["analysis"]
+            return
         
-        strengths = []
-        if best_score > 60:
-            strengths.append(f"- Strong performance in {best_section} ({best_score:.1f}%)")
+        cache_key = _cache_key("analysis", test_name, user_data)
+        cached = self.get_cached_response(cache_key)
+        if cached is not None:
+            yield cached
+            return
         
-        for section, score in percentages.items():
-            if score > 50 and section != best_section:
-                strengths.append(f"- Good grasp of {section} concepts")
+        chunks = []
+        vector = None
+        try:
+            inputs = await self.build_analysis_inputs(user_data, test_name)
+            bucket = SemanticAnalysisCache.bucket_key(test_name, user_data)
+            vector = await self.embed_for_cache(inputs["user_data"])
+            similar = self._semantic_cache.lookup(bucket, vector) if vector is not None else None
+            if similar is not None:
+                self.cache_response(cache_key, similar)
+                yield similar
+                return
+            async for chunk in self.stream_chain(self.analysis_chain, inputs, self.analysis_prompt):
+                chunks.append(chunk)
+                yield chunk
+        except Exception:
+            log.exception("Streaming AI analysis failed")
+            if not chunks:
+                yield self.generate_fallback_analysis(user_data, test_name)["analysis"]
+            return
         
-        return "\n".join(strengths) if strengths else "- Focus on building foundational concepts"
+        analysis_result = "".join(chunks)
+        self.cache_response(cache_key, analysis_result)
+        if vector is not None:
+            self._semantic_cache.add(bucket, vector, analysis_result)
     
-    def identify_weaknesses(self, section_scores: Dict[str, int], test_name: str = None) -> str:
-        if not section_scores:
-            return "- Complete more questions for detailed analysis"
+    async def analyze_performance_batch(self, users: List[Dict[str, Any]], test_name: str = None) -> Dict[str, Dict[str, Any]]:
+        """Analyze many users through OpenAI's Batch API (half price, results within 24h).
+        
+        Meant for offline cohort runs, not interactive requests. Returns a dict
+        keyed by custom_id ("<index>-<username>"); users whose batch line failed
+        get the programmatic fallback analysis.
+        """
+        custom_ids = [f"{i}-{user_data.get('username', 'user')}" for i, user_data in enumerate(users)]
+        results = {}
+        
+        if not users:
+            return results
+        
+        if not (OPENAI_AVAILABLE and os.getenv('OPENAI_API_KEY') and self.is_available()):
+            for custom_id, user_data in zip(custom_ids, users):
+                results[custom_id] = self.generate_fallback_analysis(user_data, test_name)
+            return results
+        
+        now = datetime.now()
+        current_date, days_remaining = _today_ctx()
         
-        max_sections = self.get_question_counts(test_name)
+        from langchain_core.messages import convert_to_openai_messages
         
-        percentages = {}
-        for section, score in section_scores.items():
-            if section in max_sections:
-                percentages[section] = (score / max_sections[section]) * 100
+        lines = []
+        for custom_id, user_data in zip(custom_ids, users):
+            messages = self.analysis_prompt.format_messages(
+                user_data=self.format_user_data(user_data, test_name),
+                current_date=current_date,
+                days_remaining=days_remaining
+            )
+            lines.append(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.llm.model_name,
+                    "messages": convert_to_openai_messages(messages)
+                }
+            }))
+        
+        import openai
+        # Rides the shared connection pool (closed by close_http_clients), so there is nothing to close here
+        client = openai.AsyncOpenAI(http_client=self._http_client)
+        try:
+            batch_file = await client.files.create(
+                file=("analysis_batch.jsonl", "\n".join(lines).encode("utf-8")),
+                purpose="batch"
+            )
+            batch = await client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window=BATCH_COMPLETION_WINDOW
+            )
+            
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                await asyncio.sleep(BATCH_POLL_INTERVAL)
+                batch = await client.batches.retrieve(batch.id)
+            
+            if batch.output_file_id:
+                output = await client.files.content(batch.output_file_id)
+                generated_at = now.isoformat()
+                for line in output.text.splitlines():
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    response = record.get("response") or {}
+                    if response.get("status_code") != 200:
+                        continue
+                    results[record["custom_id"]] = {
+                        "status": "success",
+                        "analysis": response["body"]["choices"][0]["message"]["content"],
+                        "generated_at": generated_at,
+                        "source": "ai_generated"
+                    }
+            else:
+                log.warning("Batch analysis %s ended with status %s", batch.id, batch.status)
+        except Exception:
+            log.exception("Batch AI analysis failed")
         
-        if not percentages:
-            return "- Complete the test for detailed analysis"
+        for custom_id, user_data in zip(custom_ids, users):
+            if custom_id not in results:
+                results[custom_id] = self.generate_fallback_analysis(user_data, test_name)
         
-        weaknesses = []
-        for section, score in percentages.items():
-            if score < 40:
-                weaknesses.append(f"- {section} needs significant improvement ({score:.1f}%)")
-            elif score < 60:
-                weaknesses.append(f"- {section} has room for improvement ({score:.1f}%)")
+        return results
+    
+    def create_analysis_prompt(self) -> "ChatPromptTemplate":
+        return _prompt_templates()[0]
+    
+    def format_user_data(self, user_data: Dict[str, Any], test_name: str = None) -> str:
+        """Render the student data block of the prompt, reusing recent identical renders"""
+        # Undated payloads are stamped with today's date, so the day is part of the key
+        today = None if 'date' in user_data else date.today().isoformat()
+        key = _cache_key("format", test_name, today, user_data)
+        with self._format_cache_lock:
+            formatted = self._format_cache.get(key)
+            if formatted is not None:
+                self._format_cache.move_to_end(key)
+                return formatted
         
-        return "\n".join(weaknesses) if weaknesses else "- Overall solid performance, focus on fine-tuning"
+        # Rendered outside the lock; a concurrent render of the same input just stores it twice
+        formatted = self.render_user_data(user_data, test_name)
+        with self._format_cache_lock:
+            self._format_cache[key] = formatted
+            if len(self._format_cache) > FORMAT_CACHE_MAX_ENTRIES:
+                self._format_cache.popitem(last=False)
+        return formatted
+    
+    def render_user_data(self, user_data: Dict[str, Any], test_name: str = None) -> str:
+        section_scores = user_data.get('section_scores', _EMPTY)
+        total_score = sum(section_scores.values())
+        
+        # Get dynamic max marks (denominators guarded against empty sections)
+        max_marks = self.get_max_marks(test_name)
+        total_max_score = self.get_total_max_marks(test_name)
+        
+        performance_insights = user_data.get('performance_insights', _EMPTY)
+        section_analysis = performance_insights.get('section_analysis', _EMPTY)
+        time_data = user_data.get('time_analysis', _EMPTY)
+        
+        buf = []
+        append = buf.append
+        optional = {}  # index in buf -> drop order when over the token budget
+        
+        test_date = user_data['date'] if 'date' in user_data else date.today().isoformat()
+        total_pct = total_score * (100.0 / max(total_max_score, 1))
+        append(f"""📋 Test Details:
+- Test: {user_data.get('test_name', 'Unknown')}
+- Date: {test_date}
+- Student: {user_data.get('username', 'Unknown')}
+
+🏆 Overall Performance:
+- Total Score: {total_score}/{total_max_score} ({total_pct:.1f}%)
+
+📊 Section-wise Performance:""")
+        
+        section_blocks = []
+        for section in SECTION_ORDER:
+            section_max = max_marks[section]
+            score = section_scores.get(section, 0)
+            sd = section_analysis.get(section, _EMPTY)
+            section_blocks.append(f"""
+{section}:
+  - Score: {score}/{section_max} ({score * (100.0 / max(section_max, 1)):.1f}%)
+  - Questions Attempted: {sd.get('attempted', 0)}
+  - Questions Correct: {sd.get('correct', 0)}
+  - Section Accuracy: {sd.get('accuracy', 0):.1f}%
+  - Time Efficiency: {sd.get('efficiency', 0):.2f} marks/minute""")
+        append("\n".join(section_blocks))
+        
+        if time_data:
+            section_times = time_data.get('section_times', _EMPTY)
+            time_rows = []
+            for section in SECTION_ORDER:
+                if section in section_times:
+                    time_rows.append(f"\n  - {section} Avg Time: {_mmss(section_times[section]['avg_time'])} per question")
+            append(f"""
+⏱️ Time Management Analysis:
+- Total Time Used: {time_data.get('total_time_formatted', 'N/A')}
+- Average per Question: {time_data.get('avg_per_question_formatted', 'N/A')}
+- Questions with Time Data: {time_data.get('attempted_count', 0)}{''.join(time_rows)}""")
+        
+        if 'question_type_performance' in performance_insights:
+            qtype_rows = "".join(
+                f"\n- {qtype}: {data['correct']}/{data['attempted']} ({data['correct'] / data['attempted'] * 100:.1f}% accuracy)"
+                for qtype, data in performance_insights['question_type_performance'].items()
+                if data['attempted'] > 0
+            )
+            if qtype_rows:
+                optional[len(buf)] = 0
+                append(f"\n🎯 Question Type Analysis:{qtype_rows}")
+        
+        overall_correct = 0
+        overall_attempted = 0
+        for sd in section_analysis.values():
+            overall_correct += sd.get('correct', 0)
+            overall_attempted += sd.get('attempted', 1)
+        optional[len(buf)] = 1
+        append(f"""
+🔍 Performance Patterns:
+- Overall questions attempted: {time_data.get('attempted_count', 0)}/66
+- Overall accuracy: {overall_correct / max(overall_attempted, 1) * 100:.1f}%""")
+        
+        return _fit_token_budget(buf, optional)
+    
+    def generate_fallback_analysis(self, user_data: Dict[str, Any], test_name: str = None) -> Dict[str, Any]:
+        section_scores = user_data.get('section_scores', {})
+        total_score = sum(section_scores.values())
+        
+        answers = user_data.get('answers', _EMPTY)
+        attempted = len(answers)
+        if attempted > NUMPY_COUNT_MIN_ANSWERS:
+            import numpy as np
+            correct = int(np.fromiter((bool(a.get('correct')) for a in answers.values()), dtype=bool, count=attempted).sum())
+        else:
+            correct = sum(bool(a.get('correct')) for a in answers.values())
+        accuracy = (correct / attempted * 100) if attempted > 0 else 0
+        
+        now = datetime.now()
+        current_date, days_remaining = _today_ctx()
+        
+        # Get dynamic max marks
+        max_marks = self.get_max_marks(test_name)
+        total_max_score = max(self.get_total_max_marks(test_name), 1)
+        scale = self.get_pct_scale(test_name)
+        
+        varc, dilr, qa = (section_scores.get(section, 0) for section in SECTION_ORDER)
+        strengths, weaknesses = self._classify_sections(section_scores, test_name)
+        analysis = _FALLBACK_TEMPLATE.format_map({
+            "total_score": total_score,
+            "total_max_score": total_max_score,
+            "total_pct": total_score * scale["total"],
+            "current_date": current_date,
+            "days_remaining": days_remaining,
+            "varc": varc, "varc_max": max_marks['VARC'], "varc_pct": varc * scale['VARC'],
+            "dilr": dilr, "dilr_max": max_marks['DILR'], "dilr_pct": dilr * scale['DILR'],
+            "qa": qa, "qa_max": max_marks['QA'], "qa_pct": qa * scale['QA'],
+            "accuracy": accuracy,
+            "correct": correct,
+            "attempted": attempted,
+            "strengths": strengths,
+            "weaknesses": weaknesses
+        })
+        
+        return {
+            "status": "success",
+            "analysis": analysis,
+            "generated_at": now.isoformat(),
+            "source": "programmatic"
+        }
+    
+    def section_percentages(self, section_scores: Dict[str, int], test_name: str = None) -> Dict[str, float]:
+        """Score percentage per known section, computed in one pass"""
+        return _section_percentages(section_scores.items(), self.get_pct_scale(test_name))
+    
+    def _classify_sections(self, section_scores: Dict[str, int], test_name: str = None) -> Tuple[str, str]:
+        """Strengths and weaknesses bullet lists, memoised on the scores and the test's scale"""
+        return _classify_scores(tuple(section_scores.items()), tuple(self.get_pct_scale(test_name).items()))
+    
+    def identify_strengths(self, section_scores: Dict[str, int], test_name: str = None) -> str:
+        return self._classify_sections(section_scores, test_name)[0]
+    
+    def identify_weaknesses(self, section_scores: Dict[str, int], test_name: str = None) -> str:
+        return self._classify_sections(section_scores, test_name)[1]
+    
+    def create_hint_prompt(self) -> "ChatPromptTemplate":
+        return _prompt_templates()[1]
     
     async def generate_question_hints(self, question_data: Dict[str, Any]) -> str:
     
         if not self.is_available():
             return "Hey! SAI here 😉 - AI hints are offline right now. Check the solution provided, or set up the OpenAI API for smart hints!"
+        if self.circuit_open():
+            return HINT_ERROR_MESSAGE
         
         try:
-            hint_prompt = ChatPromptTemplate.from_template("""
-            You are StrategyAI (call me SAI 😉) - a direct CAT strategist. A student is stuck on this question. Give them a smart hint WITHOUT spoiling the answer.
-            
-            Question: {question}
-            Question Type: {question_type}
-            Options: {options}
+            question = question_data.get("question", "")
+            question_type = question_data.get("question_type", "")
+            options = question_data.get("options", [])
             
-            Give a strategic nudge:
-            - VARC: Point to key passage clues, logical flow, or elimination strategy
-            - DILR: Suggest the approach, what data to focus on, logical sequence
-            - QA: Hint at the concept/method needed, not the calculation steps
+            cache_key = _cache_key("hint", question, question_type, options)
+            hint = self.get_cached_response(cache_key)
+            if hint is not None:
+                return hint
             
-            Keep it conversational, encouraging, and brief. End with "Give it another shot! 💪"
-            """)
-            
-            chain = hint_prompt | self.llm | StrOutputParser()
-            hint = await chain.ainvoke({
-                "question": question_data.get("question", ""),
-                "question_type": question_data.get("question_type", ""),
-                "options": str(question_data.get("options", []))
-            })
+            hint = await self.invoke_chain(self.hint_chain, {
+                "question": question,
+                "question_type": question_type,
+                "options": str(options)
+            }, self.hint_prompt, self.hint_llm)
+            self.cache_response(cache_key, hint)
             
             return hint
             
         except Exception as e:
-            print(f"Error generating hint: {e}")
-            return "Oops! SAI's having a moment. Try checking the solution or come back in a bit! 😅"
+            log.warning("Error generating hint: %s", e)
+            return HINT_ERROR_MESSAGE
+    
+    async def generate_question_hints_batch(self, questions: List[Dict[str, Any]]) -> List[str]:
+        """Generate hints for several questions concurrently, in input order.
+        
+        Requests share the compiled hint chain, the LLM semaphore and the 429/5xx
+        retry policy, so a large batch is throttled rather than rejected.
+        """
+        results = await asyncio.gather(
+            *(self.generate_question_hints(question_data) for question_data in questions),
+            return_exceptions=True
+        )
+        return [
+            HINT_ERROR_MESSAGE
+            if isinstance(result, BaseException) else result
+            for result in results
+        ]
+
+# Shared instance, built on first use so importing this module stays side-effect free
+_instance: Optional[CATAnalysisAI] = None
+_instance_lock = threading.Lock()
+
+def _get() -> CATAnalysisAI:
+    """Return the shared analyzer, constructing it on first call"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = CATAnalysisAI()
+    return _instance
 
-# Global instance
-ai_analyzer = CATAnalysisAI()
+def __getattr__(name: str):
+    # Keep `from ai_analysis import ai_analyzer` working without eager construction
+    if name == "ai_analyzer":
+        return _get()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 async def analyze_user_performance(user_data: Dict[str, Any], test_name: str = None) -> Dict[str, Any]:
     """Main function to analyze user performance"""
-    return await ai_analyzer.analyze_performance(user_data, test_name)
+    return await _get().analyze_performance(user_data, test_name)
+
+async def analyze_user_performance_many(items: List[Tuple[Dict[str, Any], Optional[str]]]) -> List[Dict[str, Any]]:
+    """Analyze several (user_data, test_name) pairs concurrently, bounded by the shared LLM limit"""
+    analyzer = _get()
+    return await asyncio.gather(*(analyzer.analyze_performance(user_data, test_name) for user_data, test_name in items))
+
+async def analyze_user_performance_stream(user_data: Dict[str, Any], test_name: str = None) -> AsyncIterator[str]:
+    """Stream the performance analysis text chunk by chunk"""
+    async for chunk in _get().analyze_performance_stream(user_data, test_name):
+        yield chunk
+
+async def analyze_user_performance_batch(users: List[Dict[str, Any]], test_name: str = None) -> Dict[str, Dict[str, Any]]:
+    """Analyze many users at once through the OpenAI Batch API (offline use)"""
+    return await _get().analyze_performance_batch(users, test_name)
 
 async def get_question_hint(question_data: Dict[str, Any]) -> str:
     """Get AI-generated hint for a question"""
-    return await ai_analyzer.generate_question_hints(question_data)
+    return await _get().generate_question_hints(question_data)
+
+async def get_question_hints_many(questions: List[Dict[str, Any]]) -> List[str]:
+    """Get hints for several questions concurrently, bounded by the shared LLM limit"""
+    return await _get().generate_question_hints_batch(questions)
 
 def is_ai_available() -> bool:
     """Check if AI features are available"""
-    return ai_analyzer.is_available()
+    return _get().is_available()
+
+async def probe_llm(timeout: float = 0.5) -> bool:
+    """Check that the configured LLM endpoint is actually reachable"""
+    return await _get().probe_llm(timeout)
 
 # if __name__ == "__main__":
 #     # Test the AI analysis system
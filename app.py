@@ -1,41 +1,73 @@
 import os
 import json
+import mmap
 import asyncio
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Tuple
 from pathlib import Path
 import uuid
+from collections import defaultdict
 import re
+import csv
+import html
+import importlib.util
+import hashlib
+from functools import lru_cache
 from io import BytesIO
 
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.pdfgen import canvas
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-
 try:
-    from ai_analysis import analyze_user_performance, is_ai_available
+    from ai_analysis import analyze_user_performance, analyze_user_performance_stream, is_ai_available
     AI_ANALYSIS_AVAILABLE = True
 except ImportError as e:
     print(f"AI Analysis module not available: {e}")
     AI_ANALYSIS_AVAILABLE = False
 
-from dotenv import load_dotenv
-load_dotenv()
+# ai_analysis may already have parsed .env; skip the second parse
+if not os.environ.get("_CAT_DOTENV_LOADED"):
+    from dotenv import load_dotenv
+    load_dotenv()
+    os.environ["_CAT_DOTENV_LOADED"] = "1"
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, Response, JSONResponse
 from pydantic import BaseModel, Field
-import pandas as pd
+
+# pandas and reportlab are imported where they are used; most requests never need them
+if TYPE_CHECKING:
+    import pandas as pd
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def json_dumps(obj, default=None) -> bytes:
+    """Compact JSON bytes (orjson when available)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=default)
+    return json.dumps(obj, default=default, separators=(",", ":")).encode()
+
+def json_loads(data):
+    """Parse JSON bytes; errors are json.JSONDecodeError subclasses either way"""
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: renders with orjson when it is installed"""
+    def render(self, content: Any) -> bytes:
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+        return super().render(content)
 
 app = FastAPI(
     title="CAT Mock Test Portal",
     description="A comprehensive CAT exam mock test platform",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # Data directories
@@ -90,193 +122,716 @@ class FlagRequest(BaseModel):
     color: str  # "red", "yellow", "green", or "none"
 
 # Load test data
+def _read_test_data_file():
+    if ORJSON_AVAILABLE:
+        # Parse straight from the mapped file, no intermediate read() copy
+        with open(DATA_DIR / "full_data.json", "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
+    with open(DATA_DIR / "full_data.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+@lru_cache(maxsize=1)
 def load_test_data():
-    """Load test data from JSON file"""
+    """Load test data from JSON file (parsed once, shared by all requests)"""
     try:
-        with open(DATA_DIR / "full_data.json", "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _read_test_data_file()
     except FileNotFoundError:
         raise HTTPException(status_code=500, detail="Test data file not found")
-    except json.JSONDecodeError:
+    except ValueError:  # json/orjson decode errors; mmap of an empty file
         raise HTTPException(status_code=500, detail="Invalid test data format")
 
+def make_question_id(section_name: str, qa: Dict[str, Any]) -> str:
+    """"{section}_{question_num}", using the first number of a multi-number question"""
+    question_num = qa.get("question_num")
+    if isinstance(question_num, list):
+        question_num = question_num[0]
+    return f"{section_name}_{question_num}"
+
+@lru_cache(maxsize=64)
+def _question_index(test_name: str):
+    """Flatten a test once into (all_questions, {question_id: question}); empty for unknown tests"""
+    all_questions = []
+    test = _test_name_index()[0].get(test_name)
+    if test is not None:
+        for section_name, section_data in test["data"].items():
+            for question_obj in section_data:
+                for qa in question_obj["qa_list"]:
+                    question_num = qa['question_num']
+                    if isinstance(question_num, list):
+                        question_num = question_num[0]
+                    
+                    all_questions.append({
+                        "question_id": make_question_id(section_name, qa),
+                        "section": section_name,
+                        "question_type": qa["question_type"],
+                        "correct_answer": qa["answer"],
+                        "question_num": question_num
+                    })
+    
+    by_id = {q["question_id"]: q for q in all_questions}
+    return all_questions, by_id
+
+@lru_cache(maxsize=64)
+def _marking_arrays(test_name: str):
+    """(correct_answers, is_mcq) arrays aligned with _question_index(test_name)[0]"""
+    import numpy as np
+    
+    all_questions = _question_index(test_name)[0]
+    correct_answers = np.array([q["correct_answer"] for q in all_questions], dtype=object)
+    is_mcq = np.array([q["question_type"] == "Multiple Choice Question" for q in all_questions], dtype=bool)
+    return correct_answers, is_mcq
+
+def _normalize_test_name(name: str) -> str:
+    return name.replace("-", "").replace("_", "").lower()
+
+@lru_cache(maxsize=1)
+def _test_name_index():
+    """({name: test}, {normalized name: test}); first test wins on duplicates"""
+    by_name, by_normalized = {}, {}
+    for test in load_test_data():
+        by_name.setdefault(test["name"], test)
+        by_normalized.setdefault(_normalize_test_name(test["name"]), test)
+    return by_name, by_normalized
+
+@lru_cache(maxsize=64)
+def _section_question_counts(test_name: str) -> Optional[Tuple[Tuple[str, int], ...]]:
+    """((section, question count), ...) for VARC/DILR/QA, or None if the test does not exist"""
+    test = _test_name_index()[0].get(test_name)
+    if test is None:
+        return None
+    return tuple((section, sum(len(q["qa_list"]) for q in test["data"][section])) for section in ("VARC", "DILR", "QA"))
+
+def section_max_marks(test_name: str) -> Dict[str, int]:
+    """Maximum marks per section (3 per question); default CAT totals for unknown tests"""
+    counts = _section_question_counts(test_name)
+    if counts is None:
+        return {"VARC": 72, "DILR": 60, "QA": 66}
+    return {section: count * 3 for section, count in counts}
+
 # Load users from file
+# users.json holds the users registered before users.jsonl existed; every
+# signup since appends one {username: record} line to users.jsonl.
 def load_users():
-    """Load users from JSON file"""
+    """Load users from users.json plus the users.jsonl signup log"""
+    users = {}
     users_file = USER_DATA_DIR / "users.json"
     if users_file.exists():
         try:
-            with open(users_file, "r") as f:
-                return json.load(f)
+            users = json_loads(users_file.read_bytes())
         except json.JSONDecodeError:
-            return {}
-    return {}
-
-# Save users to file
-def save_users():
-    """Save users to JSON file"""
-    users_file = USER_DATA_DIR / "users.json"
-    with open(users_file, "w") as f:
-        json.dump(users_db, f, indent=2)
+            users = {}
+    
+    users_log = USER_DATA_DIR / "users.jsonl"
+    if users_log.exists():
+        with open(users_log, "rb") as f:
+            for line in f:
+                try:
+                    users.update(json_loads(line))
+                except json.JSONDecodeError:
+                    continue  # blank or partially written line
+    return users
+
+# Save a new user to file
+def append_user(username: str, record: Dict[str, Any]):
+    """Append one user to users.jsonl; existing users are never rewritten"""
+    with open(USER_DATA_DIR / "users.jsonl", "ab") as f:
+        f.write(json_dumps({username: record}) + b"\n")
 
 # Initialize users database
 users_db = load_users()
 
+# Case-insensitive username index: lowercased name -> stored name (first one wins, as before)
+users_lower: Dict[str, str] = {}
+for _username in users_db:
+    users_lower.setdefault(_username.lower(), _username)
+
 def load_active_sessions():
     """Load active sessions from JSON file"""
     try:
         if SESSIONS_FILE.exists():
-            with open(SESSIONS_FILE, 'r') as f:
-                data = json.load(f)
-                # Convert datetime strings back to datetime objects
-                for session_id, session in data.items():
-                    if 'time_started' in session:
-                        session['time_started'] = datetime.fromisoformat(session['time_started'])
-                return data
+            data = json_loads(SESSIONS_FILE.read_bytes())
+            # Convert datetime strings back to datetime objects
+            now, now_monotonic = datetime.now(), time.monotonic()
+            for session_id, session in data.items():
+                if 'time_started' in session:
+                    session['time_started_iso'] = session['time_started']
+                    session['time_started'] = datetime.fromisoformat(session['time_started'])
+                    # Monotonic clocks do not survive a restart; re-anchor on the wall clock
+                    session['started_monotonic'] = now_monotonic - (now - session['time_started']).total_seconds()
+            return data
     except Exception as e:
         print(f"Error loading sessions: {e}")
     return {}
 
+def session_time_remaining(session: Dict[str, Any]) -> int:
+    """Seconds left on the session timer (may be negative once it runs out)"""
+    if "started_monotonic" in session:
+        elapsed = int(time.monotonic() - session["started_monotonic"])
+    else:
+        elapsed = int((datetime.now() - session["time_started"]).total_seconds())
+    return session["time_remaining"] - elapsed
+
+# Blocking disk work (workbooks, stats, session file) runs here, off the event loop
+_io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cat-io")
+# Serializes the read-modify-write of stats sidecars across worker threads
+_user_stats_lock = threading.Lock()
+
+def _dt_default(obj):
+    """JSON fallback serializer for session values"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _serialize_sessions() -> bytes:
+    # orjson emits naive datetimes in isoformat natively, matching load_active_sessions;
+    # _dt_default covers the stdlib fallback
+    return json_dumps(active_sessions, default=_dt_default)
+
+def _write_sessions_file(data: bytes):
+    """Atomic tmp write + rename so a crash never leaves a torn sessions file"""
+    try:
+        tmp_file = SESSIONS_FILE.with_suffix(".tmp")
+        tmp_file.write_bytes(data)
+        os.replace(tmp_file, SESSIONS_FILE)
+    except Exception as e:
+        print(f"Error saving sessions: {e}")
+
 def save_active_sessions():
     """Save active sessions to JSON file"""
     try:
-        # Convert datetime objects to strings for JSON serialization
-        sessions_to_save = {}
-        for session_id, session in active_sessions.items():
-            session_copy = session.copy()
-            if 'time_started' in session_copy:
-                session_copy['time_started'] = session_copy['time_started'].isoformat()
-            sessions_to_save[session_id] = session_copy
-        
-        with open(SESSIONS_FILE, 'w') as f:
-            json.dump(sessions_to_save, f, indent=2)
+        data = _serialize_sessions()
     except Exception as e:
         print(f"Error saving sessions: {e}")
+        return
+    _write_sessions_file(data)
+
+# Coalesce session writes: handlers set the flag, one background task flushes
+SESSION_FLUSH_DELAY = 1.0
+_sessions_dirty = asyncio.Event()
+
+async def _session_flusher():
+    """Write active sessions to disk at most once per SESSION_FLUSH_DELAY"""
+    while True:
+        await _sessions_dirty.wait()
+        await asyncio.sleep(SESSION_FLUSH_DELAY)
+        _sessions_dirty.clear()
+        # Serialize on the loop (consistent view of the dict), write on a worker thread
+        try:
+            data = _serialize_sessions()
+        except Exception as e:
+            print(f"Error saving sessions: {e}")
+            continue
+        await asyncio.get_running_loop().run_in_executor(_io_executor, _write_sessions_file, data)
 
 # Load existing sessions
 active_sessions = load_active_sessions()
 
-# Auto-save functionality
-async def auto_save_session(session_id: str):
-    """Auto-save session data every 30 seconds"""
-    while session_id in active_sessions:
-        await asyncio.sleep(30)
-        if session_id in active_sessions:
-            await save_session_data(session_id)
+# Secondary index: username -> session ids (a dict used as an ordered set,
+# so per-user iteration keeps active_sessions' insertion order)
+user_sessions: Dict[str, Dict[str, None]] = defaultdict(dict)
 
-async def save_session_data(session_id: str):
-    """Save session data to Excel file with complete test tracking"""
-    if session_id not in active_sessions:
-        return
-    
-    session = active_sessions[session_id]
-    username = session.get("username")
-    test_name = session.get("test_name", "")
-    
-    if not username or not test_name:
+def rebuild_user_sessions():
+    user_sessions.clear()
+    for session_id, session in active_sessions.items():
+        user_sessions[session.get("username")][session_id] = None
+
+def iter_user_sessions(username: str):
+    """Yield (session_id, session) for one user's sessions"""
+    for session_id in list(user_sessions.get(username, ())):
+        session = active_sessions.get(session_id)
+        if session is not None:
+            yield session_id, session
+
+def remove_session(session_id: str):
+    session = active_sessions.pop(session_id)
+    sessions = user_sessions.get(session.get("username"))
+    if sessions is not None:
+        sessions.pop(session_id, None)
+        if not sessions:
+            del user_sessions[session.get("username")]
+
+# Running (not paused) sessions older than this are dropped by the periodic GC
+STALE_SESSION_AGE = timedelta(hours=24)
+SESSION_GC_INTERVAL = 600
+
+def remove_stale_sessions() -> int:
+    """Remove running sessions started more than STALE_SESSION_AGE ago; returns how many"""
+    cutoff = datetime.now() - STALE_SESSION_AGE
+    stale = [
+        session_id for session_id, session in active_sessions.items()
+        if not session.get("is_paused", False)
+        and not (isinstance(session.get("time_started"), datetime) and session["time_started"] > cutoff)
+    ]
+    # Delete in place (keeps the per-user index in sync)
+    for session_id in stale:
+        remove_session(session_id)
+    if stale:
+        _sessions_dirty.set()
+    return len(stale)
+
+async def _periodic_session_gc():
+    while True:
+        await asyncio.sleep(SESSION_GC_INTERVAL)
+        removed = remove_stale_sessions()
+        if removed:
+            print(f"Removed {removed} stale sessions")
+
+rebuild_user_sessions()
+
+@app.on_event("startup")
+async def start_session_flusher():
+    app.state.session_flusher = asyncio.create_task(_session_flusher())
+
+@app.on_event("startup")
+async def start_autosave():
+    app.state.autosave = asyncio.create_task(_periodic_autosave())
+
+@app.on_event("startup")
+async def start_session_gc():
+    app.state.session_gc = asyncio.create_task(_periodic_session_gc())
+
+@app.on_event("shutdown")
+async def flush_sessions_on_shutdown():
+    app.state.session_gc.cancel()
+    app.state.autosave.cancel()
+    app.state.session_flusher.cancel()
+    if _sessions_dirty.is_set():
+        save_active_sessions()
+
+# Auto-save functionality: one timer for all running sessions
+AUTO_SAVE_INTERVAL = 30
+
+async def _periodic_autosave():
+    """Every AUTO_SAVE_INTERVAL seconds, save running (not paused) sessions with unsaved changes"""
+    while True:
+        await asyncio.sleep(AUTO_SAVE_INTERVAL)
+        for session_id, session in list(active_sessions.items()):
+            if session.get("is_paused") or not session_is_dirty(session):
+                continue
+            try:
+                await save_session_data(session_id)
+            except Exception as e:
+                print(f"Auto-save failed for session {session_id}: {e}")
+
+# User progress storage: every save appends its rows, tagged with the attempt
+# name, to user_data/{username}/attempts.csv; XLSX is only built on download.
+# Autosaves of a session are separate attempts until the session is cleaned up,
+# when only its final save is kept, so the file grows by one attempt per sitting.
+# Older data is still read so existing users keep their history: one sheet per
+# attempt in user_data/{username}_progress.xlsx, or one workbook per attempt in
+# user_data/{username}/Attempt_*.xlsx.
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# python-calamine (Rust) parses xlsx far faster than openpyxl; None keeps pandas' default
+EXCEL_READ_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else None
+
+def legacy_progress_file(username: str) -> Path:
+    return USER_DATA_DIR / f"{username}_progress.xlsx"
+
+def user_attempts_dir(username: str) -> Path:
+    return USER_DATA_DIR / username
+
+def user_attempts_csv(username: str) -> Path:
+    return user_attempts_dir(username) / "attempts.csv"
+
+def user_attempt_files(username: str) -> List[Path]:
+    """Per-attempt workbooks, oldest first (names embed the timestamp)"""
+    attempts_dir = user_attempts_dir(username)
+    if not attempts_dir.is_dir():
+        return []
+    return sorted(attempts_dir.glob("Attempt_*.xlsx"))
+
+def has_attempts_since_legacy(username: str) -> bool:
+    return user_attempts_csv(username).exists() or bool(user_attempt_files(username))
+
+def has_user_progress(username: str) -> bool:
+    return legacy_progress_file(username).exists() or has_attempts_since_legacy(username)
+
+# Answers and IDs stay text ("5" must not come back as 5.0, blanks as NaN);
+# only the Total_Score column, blank on all but the last row, reads blanks as NaN
+ATTEMPTS_CSV_READ_OPTIONS = {
+    "dtype": {"User_Answer": str, "Correct_Answer": str, "Question_ID": str},
+    "keep_default_na": False,
+    "na_values": {"Total_Score": [""]},
+}
+
+def load_user_attempts(username: str) -> Dict[str, "pd.DataFrame"]:
+    """Return {attempt_name: DataFrame} across the attempts CSV and older workbooks"""
+    import pandas as pd
+    
+    df_dict = {}
+    legacy_file = legacy_progress_file(username)
+    if legacy_file.exists():
+        with pd.ExcelFile(legacy_file, engine=EXCEL_READ_ENGINE) as xl_file:
+            for sheet_name in xl_file.sheet_names:
+                df_dict[sheet_name] = pd.read_excel(xl_file, sheet_name=sheet_name)
+    for attempt_file in user_attempt_files(username):
+        df_dict[attempt_file.stem] = pd.read_excel(attempt_file, sheet_name=0, engine=EXCEL_READ_ENGINE)
+    
+    attempts_csv = user_attempts_csv(username)
+    if attempts_csv.exists():
+        all_rows = pd.read_csv(attempts_csv, **ATTEMPTS_CSV_READ_OPTIONS)
+        for attempt_name, rows in all_rows.groupby("Attempt", sort=False):
+            df_dict[attempt_name] = _csv_attempt_rows(rows)
+    return df_dict
+
+def _csv_attempt_rows(rows: "pd.DataFrame") -> "pd.DataFrame":
+    # Saves within the same second share an attempt name; the last one wins
+    rows = rows.drop(columns="Attempt").drop_duplicates("Question_ID", keep="last")
+    return rows.reset_index(drop=True)
+
+# Latest-attempt readers are cached per (path, mtime_ns): every save rewrites
+# or appends to the file, which bumps mtime_ns and so misses the cache.
+def _file_version(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+@lru_cache(maxsize=128)
+def _latest_csv_attempt(path_str: str, mtime_ns: int) -> Optional[Tuple[str, "pd.DataFrame"]]:
+    import pandas as pd
+    all_rows = pd.read_csv(path_str, **ATTEMPTS_CSV_READ_OPTIONS)
+    if all_rows.empty:
+        return None
+    latest_name = all_rows["Attempt"].max()
+    return latest_name, _csv_attempt_rows(all_rows[all_rows["Attempt"] == latest_name])
+
+@lru_cache(maxsize=128)
+def _attempt_workbook(path_str: str, mtime_ns: int) -> "pd.DataFrame":
+    import pandas as pd
+    return pd.read_excel(path_str, sheet_name=0, engine=EXCEL_READ_ENGINE)
+
+@lru_cache(maxsize=128)
+def _latest_legacy_sheet(path_str: str, mtime_ns: int) -> Optional[Tuple[str, "pd.DataFrame"]]:
+    import pandas as pd
+    with pd.ExcelFile(path_str, engine=EXCEL_READ_ENGINE) as xl_file:
+        latest_sheet = max(xl_file.sheet_names, default=None)
+        if latest_sheet is None:
+            return None
+        return latest_sheet, pd.read_excel(xl_file, sheet_name=latest_sheet)
+
+def load_latest_user_attempt(username: str) -> Optional[Tuple[str, "pd.DataFrame"]]:
+    """Return (attempt_name, DataFrame) for the most recent attempt only, or None.
+    
+    Same precedence as load_user_attempts, but older attempts are never parsed.
+    The DataFrame is a copy, so callers are free to modify it.
+    """
+    candidates = []
+    attempts_csv = user_attempts_csv(username)
+    mtime_ns = _file_version(attempts_csv)
+    if mtime_ns is not None:
+        candidates.append(_latest_csv_attempt(str(attempts_csv), mtime_ns))
+    
+    attempt_files = user_attempt_files(username)
+    if attempt_files:
+        latest_file = attempt_files[-1]
+        latest_name = latest_file.stem
+        if all(c is None or latest_name > c[0] for c in candidates):
+            candidates.append((latest_name, _attempt_workbook(str(latest_file), latest_file.stat().st_mtime_ns)))
+    
+    legacy_file = legacy_progress_file(username)
+    mtime_ns = _file_version(legacy_file)
+    if mtime_ns is not None:
+        candidates.append(_latest_legacy_sheet(str(legacy_file), mtime_ns))
+    
+    # Later sources only win with a strictly newer name, as in load_user_attempts
+    latest = None
+    for candidate in candidates:
+        if candidate is not None and (latest is None or candidate[0] > latest[0]):
+            latest = candidate
+    if latest is None:
+        return None
+    return latest[0], latest[1].copy()
+
+def _append_attempt_csv(path: Path, attempt_name: str, rows: List[Dict[str, Any]], header: List[str]):
+    """Append one attempt's rows (header only when the file is new)"""
+    with open(path, "a", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        writer = csv.writer(f)
+        if f.tell() == 0:
+            writer.writerow(["Attempt", *header])
+        writer.writerows([attempt_name, *(row[name] for name in header)] for row in rows)
+
+def _drop_csv_attempts(path: Path, attempt_names: set) -> int:
+    """Rewrite the attempts CSV without the named attempts; returns how many were found"""
+    found = set()
+    tmp_path = path.with_suffix(".tmp")
+    with open(path, newline="", encoding="utf-8") as src, \
+            open(tmp_path, "w", newline="", encoding="utf-8", buffering=1 << 20) as dst:
+        writer = csv.writer(dst)
+        for i, row in enumerate(csv.reader(src)):
+            if i and row and row[0] in attempt_names:
+                found.add(row[0])
+                continue
+            writer.writerow(row)
+    if found:
+        os.replace(tmp_path, path)
+    else:
+        tmp_path.unlink()
+    return len(found)
+
+def drop_superseded_attempts(username: str, attempt_names: List[str]):
+    """Remove a finished session's earlier autosaves, keeping only its final attempt"""
+    attempts_csv = user_attempts_csv(username)
+    if not attempt_names or not attempts_csv.exists():
         return
+    with _user_stats_lock:
+        dropped = _drop_csv_attempts(attempts_csv, set(attempt_names))
+        stats = load_user_stats(username)
+        if dropped and stats is not None:
+            stats["total_attempts"] = max(stats.get("total_attempts", 0) - dropped, 0)
+            save_user_stats(username, stats)
+
+# Stats sidecar: a running summary of the user's attempts so /api/user-stats
+# never has to re-read the workbooks.
+# {"total_attempts": n, "latest_sheet": ..., "last_test_date": ...,
+#  "tests": {test_name: {"latest_sheet", "score", "time", "questions", "correct", "timestamp"}}}
+def user_stats_file(username: str) -> Path:
+    return USER_DATA_DIR / f"{username}_stats.json"
+
+def load_user_stats(username: str) -> Optional[Dict[str, Any]]:
+    stats_file = user_stats_file(username)
+    try:
+        data = stats_file.read_bytes()
+    except FileNotFoundError:
+        return None
+    return json_loads(data)
+
+def save_user_stats(username: str, stats: Dict[str, Any]):
+    data = json_dumps(stats)
+    stats_file = user_stats_file(username)
+    tmp_file = stats_file.with_suffix(".tmp")
+    tmp_file.write_bytes(data)
+    os.replace(tmp_file, stats_file)
+
+def record_attempt_stats(stats: Dict[str, Any], sheet_name: str, test_name: str, score, time_spent,
+                         questions: int, correct: int, timestamp, new_attempt: bool = True):
+    """Fold one attempt into the stats summary (only the latest attempt per test counts)"""
+    if new_attempt:
+        stats["total_attempts"] = stats.get("total_attempts", 0) + 1
+    if stats.get("latest_sheet") is None or sheet_name > stats["latest_sheet"]:
+        stats["latest_sheet"] = sheet_name
+        stats["last_test_date"] = timestamp
+    
+    tests = stats.setdefault("tests", {})
+    if test_name not in tests or sheet_name > tests[test_name]["latest_sheet"]:
+        tests[test_name] = {
+            "latest_sheet": sheet_name,
+            "score": score,
+            "time": time_spent,
+            "questions": questions,
+            "correct": correct,
+            "timestamp": timestamp
+        }
+
+def build_user_stats(df_dict: Dict[str, "pd.DataFrame"]) -> Dict[str, Any]:
+    """Build the stats summary from workbook data (migration path for older users)"""
+    import pandas as pd
+    
+    stats = {"total_attempts": len(df_dict), "latest_sheet": None, "last_test_date": None, "tests": {}}
+    if not df_dict:
+        return stats
+    
+    stats["latest_sheet"] = max(df_dict)
+    frames = {name: sheet_data for name, sheet_data in df_dict.items() if not sheet_data.empty}
+    if not frames:
+        return stats
+    
+    # One frame for every attempt, reduced per sheet with vectorized groupby ops
+    big = pd.concat(frames, names=['sheet', 'row']).reset_index(level='row', drop=True)
+    for column in ('Test_Name', 'Attempt_Timestamp', 'Time_Spent', 'Marks_Obtained', 'Total_Score', 'User_Answer', 'Correct_Answer'):
+        if column not in big.columns:
+            big[column] = pd.NA
+    
+    big['correct'] = big['User_Answer'] == big['Correct_Answer']
+    by_sheet = big.groupby(level='sheet', sort=False)
+    per_sheet = pd.DataFrame({
+        'test_name': by_sheet['Test_Name'].first(),
+        'timestamp': by_sheet['Attempt_Timestamp'].first(),
+        'time': by_sheet['Time_Spent'].sum(),
+        'score': by_sheet['Marks_Obtained'].sum(min_count=1),
+        'total_score': by_sheet['Total_Score'].last(),
+        'questions': by_sheet.size(),
+        'correct': by_sheet['correct'].sum()
+    })
+    # Older sheets without Marks_Obtained carry the total in the last Total_Score value
+    per_sheet['score'] = per_sheet['score'].fillna(per_sheet['total_score'])
+    
+    latest_timestamp = per_sheet['timestamp'].get(stats["latest_sheet"])
+    if latest_timestamp is not None and not pd.isna(latest_timestamp):
+        stats["last_test_date"] = str(latest_timestamp)
+    
+    # Latest attempt per test, tests listed in the order they first appear
+    per_sheet = per_sheet[per_sheet['test_name'].notna()]
+    order = per_sheet['test_name'].drop_duplicates()
+    latest = per_sheet.sort_index().groupby('test_name').tail(1)
+    latest_by_test = {row.test_name: row for row in latest.itertuples()}
+    for test_name in order:
+        row = latest_by_test[test_name]
+        stats["tests"][str(test_name)] = {
+            "latest_sheet": row.Index,
+            "score": None if pd.isna(row.score) else float(row.score),
+            "time": float(row.time),
+            "questions": int(row.questions),
+            "correct": int(row.correct),
+            "timestamp": None if pd.isna(row.timestamp) else str(row.timestamp)
+        }
+    return stats
+
+def migrate_user_stats(username: str) -> Dict[str, Any]:
+    """Build and save the sidecar from the workbooks, once (users from before the sidecar)"""
+    with _user_stats_lock:
+        # A save or another request may have written it while we waited for the lock
+        stats = load_user_stats(username)
+        if stats is None:
+            stats = build_user_stats(load_user_attempts(username))
+            save_user_stats(username, stats)
+        return stats
+
+def session_is_dirty(session: Dict[str, Any]) -> bool:
+    """True when answers, bookmarks or flags changed since the last attempt save.
+    
+    Sessions without the flag (restored from an older sessions file) count as dirty.
+    """
+    return session.get("dirty", True)
+
+async def save_session_data(session_id: str) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """Save session data to Excel file with complete test tracking.
     
-    # Create Excel file for user (ensure consistent naming)
-    excel_file = USER_DATA_DIR / f"{username}_progress.xlsx"
+    Returns (attempt_name, rows) for the attempt just written, or None if nothing was saved.
+    """
+    if session_id not in active_sessions:
+        return None
     
-    # Load test data to get all questions
-    test_data = load_test_data()
-    all_questions = []
+    session = active_sessions[session_id]
+    if not session.get("username") or not session.get("test_name", ""):
+        return None
     
-    # Get all questions from the test
-    for test in test_data:
-        if test["name"] == test_name:
-            # Flatten all questions with their details
-            for section_name, section_data in test["data"].items():
-                for question_obj in section_data:
-                    for qa in question_obj["qa_list"]:
-                        question_num = qa['question_num']
-                        if isinstance(question_num, list):
-                            question_num = question_num[0]
-                        
-                        question_id = f"{section_name}_{question_num}"
-                        all_questions.append({
-                            "question_id": question_id,
-                            "section": section_name,
-                            "question_type": qa["question_type"],
-                            "correct_answer": qa["answer"],
-                            "question_num": question_num
-                        })
-            break
+    # Snapshot the mutable parts so request handlers can keep updating the live session
+    snapshot = {
+        **session,
+        "answers": dict(session["answers"]),
+        "bookmarks": list(session.get("bookmarks", [])),
+        "flags": dict(session.get("flags", {}))
+    }
+    all_questions = _question_index(snapshot["test_name"])[0]
+    # Changes made while the write runs mark the session dirty again
+    session["dirty"] = False
+    try:
+        saved = await asyncio.get_running_loop().run_in_executor(_io_executor, _save_session_data_sync, snapshot, all_questions)
+    except Exception:
+        session["dirty"] = True
+        raise
+    if saved is not None:
+        # Every save is its own attempt; all but the last are dropped when the session ends
+        saved_attempts = session.setdefault("saved_attempts", [])
+        if saved[0] not in saved_attempts:
+            saved_attempts.append(saved[0])
+    return saved
+
+def _save_session_data_sync(session: Dict[str, Any], all_questions: List[Dict[str, Any]]) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """Build the attempt rows for a session snapshot and write them to disk"""
+    username = session["username"]
+    test_name = session["test_name"]
+    
+    import numpy as np
+    
+    # Calculate marks based on CAT marking scheme, for all questions at once:
+    # +3 correct, -1 wrong MCQ, 0 wrong TITA, 0 unattempted
+    correct_answers, is_mcq = _marking_arrays(test_name)
+    answers = [session["answers"].get(q["question_id"], {}) for q in all_questions]
+    user_answers = np.array([answer_data.get("answer", "") for answer_data in answers], dtype=object)
+    attempted = user_answers.astype(bool)
+    correct = attempted & (user_answers == correct_answers).astype(bool)
+    marks = np.where(correct, 3, np.where(attempted & is_mcq, -1, 0))
+    total_score = int(marks.sum())
     
     # Prepare complete data for Excel (ALL questions, not just answered ones)
     data = []
-    total_score = 0
+    last_index = len(all_questions) - 1
     
-    for q in all_questions:
+    for i, (q, answer_data, user_answer, mark) in enumerate(zip(all_questions, answers, user_answers.tolist(), marks.tolist())):
         question_id = q["question_id"]
-        answer_data = session["answers"].get(question_id, {})
-        user_answer = answer_data.get("answer", "")
-        correct_answer = q["correct_answer"]
-        question_type = q["question_type"]
-        
-        # Calculate marks based on CAT marking scheme
-        marks = 0
-        if user_answer:  # Question was attempted
-            if user_answer == correct_answer:
-                marks = 3  # +3 for correct answer
-            else:
-                if question_type == "Multiple Choice Question":
-                    marks = -1  # -1 for wrong MCQ
-                else:  # TITA
-                    marks = 0   # 0 for wrong TITA
-        else:
-            marks = 0  # 0 for unattempted
-        
-        total_score += marks
-        
         data.append({
             "Question_ID": question_id,
             "Section": q["section"],
             "Question_Number": q["question_num"],
-            "Question_Type": question_type,
+            "Question_Type": q["question_type"],
             "User_Answer": user_answer,
-            "Correct_Answer": correct_answer,
-            "Marks_Obtained": marks,
+            "Correct_Answer": q["correct_answer"],
+            "Marks_Obtained": mark,
             "Time_Spent": answer_data.get("time_spent", 0),
             "Bookmark_Status": question_id in session.get("bookmarks", []),
             "Flag_Color": session.get("flags", {}).get(question_id, "none"),
             "Attempt_Timestamp": answer_data.get("timestamp", datetime.now().isoformat()),
             "Test_Name": test_name,
-            "Total_Score": total_score if question_id == all_questions[-1]["question_id"] else ""  # Only show total in last row
+            "Total_Score": total_score if i == last_index else ""  # Only show total in last row
         })
     
     if data:
-        df = pd.DataFrame(data)
         sheet_name = f'Attempt_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
         
         try:
-            # Create or append to existing Excel file
-            if excel_file.exists():
-                # Read existing file and add new sheet
-                with pd.ExcelWriter(excel_file, mode='a', if_sheet_exists='replace', engine='openpyxl') as writer:
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
-            else:
-                # Create new file
-                with pd.ExcelWriter(excel_file, engine='openpyxl') as writer:
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+            # Append-only; earlier attempts are never re-read or rewritten
+            attempts_dir = user_attempts_dir(username)
+            attempts_dir.mkdir(exist_ok=True)
+            with _user_stats_lock:
+                stats = load_user_stats(username)
+                if stats is None and not has_user_progress(username):
+                    stats = {}
+                _append_attempt_csv(user_attempts_csv(username), sheet_name, data, list(data[0]))
+                # Saves within the same second reuse the attempt name and replace it
+                new_attempt = stats is not None and stats.get("latest_sheet") != sheet_name
+                
+                # Users with workbook history but no sidecar yet are migrated on the next stats read
+                if stats is not None:
+                    record_attempt_stats(
+                        stats, sheet_name, test_name, total_score,
+                        sum(row["Time_Spent"] for row in data),
+                        len(data),
+                        sum(1 for row in data if row["User_Answer"] and row["User_Answer"] == row["Correct_Answer"]),
+                        data[0]["Attempt_Timestamp"],
+                        new_attempt
+                    )
+                    save_user_stats(username, stats)
             
-            print(f"Successfully saved Excel file for {username}")
+            print(f"Successfully saved progress for {username}")
         except Exception as e:
-            print(f"Error saving Excel file for {username}: {e}")
+            print(f"Error saving progress for {username}: {e}")
             raise HTTPException(status_code=500, detail=f"Failed to save progress: {str(e)}")
+        return sheet_name, data
+    return None
 
 # API Routes
 
+# index.html is held in memory and re-read only when its mtime changes
+@lru_cache(maxsize=1)
+def _index_page(mtime_ns: int) -> Tuple[bytes, Dict[str, str]]:
+    content = (FRONTEND_DIR / "index.html").read_bytes()
+    headers = {
+        "ETag": f'"{hashlib.blake2b(content, digest_size=8).hexdigest()}"',
+        "Cache-Control": "public, max-age=60",
+    }
+    return content, headers
+
+def _index_response(request: Request, include_body: bool) -> Response:
+    content, headers = _index_page((FRONTEND_DIR / "index.html").stat().st_mtime_ns)
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    if not include_body:
+        return Response(media_type="text/html", headers={**headers, "Content-Length": str(len(content))})
+    return Response(content=content, media_type="text/html", headers=headers)
+
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Serve the main application page"""
-    return FileResponse("frontend/index.html")
+    return _index_response(request, include_body=True)
 
 @app.head("/")
-async def root_head():
+async def root_head(request: Request):
     """Handle HEAD requests for the main page"""
-    return FileResponse("frontend/index.html")
+    return _index_response(request, include_body=False)
 
 @app.get("/test_debug.html")
 async def debug_page():
@@ -289,9 +844,8 @@ async def signup(user: User):
     username_lower = user.username.lower()
     
     # Check if username already exists (case-insensitive)
-    for existing_username in users_db.keys():
-        if existing_username.lower() == username_lower:
-            raise HTTPException(status_code=400, detail="Username already exists")
+    if username_lower in users_lower:
+        raise HTTPException(status_code=400, detail="Username already exists")
     
     # Store user with original case
     users_db[user.username] = {
@@ -299,8 +853,9 @@ async def signup(user: User):
         "created_at": datetime.now().isoformat(),
         "total_attempts": 0
     }
+    users_lower[username_lower] = user.username
     
-    save_users()
+    append_user(user.username, users_db[user.username])
     
     return {
         "message": "User registered successfully",
@@ -314,14 +869,8 @@ async def login(request: LoginRequest):
     username_lower = request.username.lower()
     
     # Find user (case-insensitive)
-    user_data = None
-    actual_username = None
-    
-    for username, data in users_db.items():
-        if username.lower() == username_lower:
-            user_data = data
-            actual_username = username
-            break
+    actual_username = users_lower.get(username_lower)
+    user_data = users_db.get(actual_username) if actual_username else None
     
     if not user_data:
         raise HTTPException(status_code=404, detail="User not found")
@@ -332,29 +881,37 @@ async def login(request: LoginRequest):
         "name": user_data["name"]
     }
 
-@app.get("/api/tests")
-async def get_available_tests():
-    """Get list of available test papers"""
-    test_data = load_test_data()
-    
+@lru_cache(maxsize=1)
+def _available_tests_payload() -> bytes:
+    """Serialized test list; test definitions do not change until a reload"""
     tests = []
-    for test in test_data:
+    for test in load_test_data():
         # Count actual questions, not question groups
-        varc_count = sum(len(q["qa_list"]) for q in test["data"]["VARC"])
-        dilr_count = sum(len(q["qa_list"]) for q in test["data"]["DILR"])
-        qa_count = sum(len(q["qa_list"]) for q in test["data"]["QA"])
-        
+        counts = {section: sum(len(q["qa_list"]) for q in test["data"][section]) for section in ("VARC", "DILR", "QA")}
         tests.append({
             "name": test["name"],
-            "sections": {
-                "VARC": varc_count,
-                "DILR": dilr_count,
-                "QA": qa_count
-            },
-            "total_questions": varc_count + dilr_count + qa_count
+            "sections": counts,
+            "total_questions": sum(counts.values())
         })
-    
-    return tests
+    return json_dumps(tests)
+
+@app.get("/api/tests")
+async def get_available_tests():
+    """Get list of available test papers"""
+    return Response(content=_available_tests_payload(), media_type="application/json")
+
+@app.post("/api/reload-test-data")
+async def reload_test_data():
+    """Drop the cached test data so edits to full_data.json are picked up"""
+    load_test_data.cache_clear()
+    _question_index.cache_clear()
+    _marking_arrays.cache_clear()
+    _test_name_index.cache_clear()
+    _section_question_counts.cache_clear()
+    _build_ai_performance_data.cache_clear()
+    _test_data_bytes.cache_clear()
+    _available_tests_payload.cache_clear()
+    return {"message": "Test data reloaded", "tests": len(load_test_data())}
 
 @app.post("/api/start-test")
 async def start_test(request: dict):
@@ -365,22 +922,25 @@ async def start_test(request: dict):
     if not username or not test_name:
         raise HTTPException(status_code=400, detail="Username and test name are required")
     
+    if test_name not in _test_name_index()[0]:
+        raise HTTPException(status_code=404, detail="Test not found")
+    
     # Clean up old sessions for this user to prevent confusion
     sessions_to_remove = []
-    for sid, session in active_sessions.items():
-        if session.get("username") == username:
-            # Keep paused sessions, remove active ones (including old sessions without is_paused field)
-            if not session.get("is_paused", False):
-                sessions_to_remove.append(sid)
+    for sid, session in iter_user_sessions(username):
+        # Keep paused sessions, remove active ones (including old sessions without is_paused field)
+        if not session.get("is_paused", False):
+            sessions_to_remove.append(sid)
     
     for sid in sessions_to_remove:
-        del active_sessions[sid]
+        remove_session(sid)
         print(f"Cleaned up old session {sid} for user {username}")
     
     print(f"Cleaned up {len(sessions_to_remove)} old sessions for {username}")
     
     # Generate session ID
     session_id = str(uuid.uuid4())
+    started = datetime.now()
     
     # Create session
     active_sessions[session_id] = {
@@ -391,7 +951,9 @@ async def start_test(request: dict):
         "answers": {},
         "bookmarks": [],
         "flags": {},
-        "time_started": datetime.now(),
+        "time_started": started,
+        "time_started_iso": started.isoformat(),  # formatted once; /api/session is polled
+        "started_monotonic": time.monotonic(),
         "time_remaining": 7200,  # 120 minutes in seconds
         "section_times": {
             "VARC": 2400,  # 40 minutes in seconds
@@ -400,12 +962,10 @@ async def start_test(request: dict):
         },
         "is_paused": False
     }
+    user_sessions[username][session_id] = None
     
-    # Save sessions to disk
-    save_active_sessions()
-    
-    # Start auto-save task
-    asyncio.create_task(auto_save_session(session_id))
+    # Save sessions to disk (the periodic auto-save picks the session up from here)
+    _sessions_dirty.set()
     
     return {
         "session_id": session_id,
@@ -414,16 +974,27 @@ async def start_test(request: dict):
         "time_remaining": 7200
     }
 
+@lru_cache(maxsize=64)
+def _test_data_bytes(test_name: str) -> Tuple[bytes, str]:
+    """Pre-serialized JSON for one existing test's data and its ETag"""
+    content = json_dumps(_test_name_index()[0][test_name]["data"])
+    return content, f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
 @app.get("/api/test-data/{test_name}")
-async def get_test_data(test_name: str):
-    """Get test data for a specific test"""
-    test_data = load_test_data()
+async def get_test_data(test_name: str, request: Request):
+    """Get test data for a specific test (304 when the client's copy is current)"""
+    # Only existing names reach the cache, so unknown URLs cannot grow it
+    if test_name not in _test_name_index()[0]:
+        raise HTTPException(status_code=404, detail="Test not found")
     
-    for test in test_data:
-        if test["name"] == test_name:
-            return test["data"]
+    cached = _test_data_bytes(test_name)
+    content, etag = cached
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
     
-    raise HTTPException(status_code=404, detail="Test not found")
+    return Response(content=content, media_type="application/json", headers=headers)
 
 @app.get("/api/session/{session_id}")
 async def get_session(session_id: str):
@@ -433,15 +1004,24 @@ async def get_session(session_id: str):
     
     session = active_sessions[session_id]
     
-    # Calculate remaining time
-    elapsed = datetime.now() - session["time_started"]
-    remaining = session["time_remaining"] - int(elapsed.total_seconds())
-    
-    return {
+    state = {
         **session,
-        "time_remaining": max(0, remaining),
-        "time_started": session["time_started"].isoformat()
+        "time_remaining": max(0, session_time_remaining(session)),
+        "time_started": session.get("time_started_iso") or session["time_started"].isoformat()
     }
+    state.pop("started_monotonic", None)  # process-local clock, meaningless to clients
+    state.pop("dirty", None)
+    state.pop("time_started_iso", None)
+    return state
+
+@app.get("/api/session/{session_id}/time")
+async def get_session_time(session_id: str):
+    """Get only the remaining time of a session (for timer polling)"""
+    session = active_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return {"time_remaining": max(0, session_time_remaining(session))}
 
 @app.post("/api/submit-answer")
 async def submit_answer(submission: AnswerSubmission):
@@ -451,37 +1031,16 @@ async def submit_answer(submission: AnswerSubmission):
     
     session = active_sessions[submission.session_id]
     
-    # Load test data to get correct answer
-    test_data = load_test_data()
-    correct_answer = ""
-    section = ""
-    
-    # Find correct answer in test data
-    for test in test_data:
-        if test["name"] == session["test_name"]:
-            for section_name, questions in test["data"].items():
-                for question_obj in questions:
-                    for qa in question_obj["qa_list"]:
-                        q_id = f"{section_name}_{qa['question_num']}"
-                        if isinstance(qa['question_num'], list):
-                            q_id = f"{section_name}_{qa['question_num'][0]}"
-                        
-                        if q_id == submission.question_id:
-                            correct_answer = qa["answer"]
-                            section = section_name
-                            break
-    
-    # Store answer
+    # Store answer (graded against the test index when the attempt is saved)
     session["answers"][submission.question_id] = {
         "answer": submission.answer,
-        "correct_answer": correct_answer,
         "time_spent": submission.time_spent,
-        "timestamp": datetime.now().isoformat(),
-        "section": section
+        "timestamp": datetime.now().isoformat()
     }
     
     # Save sessions to disk to persist answers
-    save_active_sessions()
+    session["dirty"] = True
+    _sessions_dirty.set()
     
     return {"message": "Answer submitted successfully"}
 
@@ -501,7 +1060,8 @@ async def toggle_bookmark(request: BookmarkRequest):
             session["bookmarks"].remove(request.question_id)
     
     # Save sessions to disk to persist bookmarks
-    save_active_sessions()
+    session["dirty"] = True
+    _sessions_dirty.set()
     
     return {"message": f"Bookmark {request.action}ed successfully"}
 
@@ -519,7 +1079,8 @@ async def set_flag(request: FlagRequest):
         session["flags"][request.question_id] = request.color
     
     # Save sessions to disk to persist flags
-    save_active_sessions()
+    session["dirty"] = True
+    _sessions_dirty.set()
     
     return {"message": "Flag updated successfully"}
 
@@ -543,14 +1104,13 @@ async def pause_test(request: dict):
     session = active_sessions[session_id]
     
     # Save current time remaining
-    elapsed = datetime.now() - session["time_started"]
-    session["time_remaining"] = session["time_remaining"] - int(elapsed.total_seconds())
+    session["time_remaining"] = session_time_remaining(session)
     session["paused_at"] = datetime.now().isoformat()
     session["is_paused"] = True
     
     # Save session data to Excel and persist sessions to disk
     await save_session_data(session_id)
-    save_active_sessions()
+    _sessions_dirty.set()
     
     return {"message": "Test paused successfully"}
 
@@ -560,29 +1120,7 @@ async def cleanup_all_sessions():
     initial_count = len(active_sessions)
     
     # Keep only paused sessions and recent active sessions (within last 24 hours)
-    current_time = datetime.now()
-    sessions_to_keep = {}
-    
-    for session_id, session in active_sessions.items():
-        time_started = session.get("time_started")
-        is_paused = session.get("is_paused", False)
-        
-        # Keep if paused or if started within last 24 hours
-        if is_paused:
-            sessions_to_keep[session_id] = session
-        elif isinstance(time_started, datetime):
-            age = (current_time - time_started).total_seconds()
-            if age < 24 * 3600:  # Less than 24 hours old
-                sessions_to_keep[session_id] = session
-    
-    # Update active sessions
-    active_sessions.clear()
-    active_sessions.update(sessions_to_keep)
-    
-    # Save cleaned sessions
-    save_active_sessions()
-    
-    cleaned_count = initial_count - len(active_sessions)
+    cleaned_count = remove_stale_sessions()
     return {
         "message": f"Cleaned up {cleaned_count} stale sessions",
         "before": initial_count,
@@ -594,9 +1132,8 @@ async def get_paused_tests(username: str):
     """Get all paused tests for a user"""
     paused_tests = []
     
-    for session_id, session in active_sessions.items():
-        if (session.get("username") == username and 
-            session.get("is_paused", False) and
+    for session_id, session in iter_user_sessions(username):
+        if (session.get("is_paused", False) and
             session.get("paused_at")):
             
             # Calculate progress
@@ -621,13 +1158,11 @@ async def get_paused_tests(username: str):
 @app.get("/api/active-session/{username}")
 async def get_active_session(username: str):
     """Get active non-paused session for a user (for page refresh recovery)"""
-    for session_id, session in active_sessions.items():
-        if (session.get("username") == username and 
-            not session.get("is_paused", False)):
+    for session_id, session in iter_user_sessions(username):
+        if not session.get("is_paused", False):
             
             # Calculate time remaining
-            elapsed = datetime.now() - session["time_started"]
-            remaining = session["time_remaining"] - int(elapsed.total_seconds())
+            remaining = session_time_remaining(session)
             
             return {
                 "session_id": session_id,
@@ -648,8 +1183,14 @@ async def cleanup_session(request: dict):
     """Clean up a specific session"""
     session_id = request.get("session_id")
     if session_id and session_id in active_sessions:
-        del active_sessions[session_id]
-        save_active_sessions()
+        session = active_sessions[session_id]
+        remove_session(session_id)
+        _sessions_dirty.set()
+        superseded = session.get("saved_attempts", [])[:-1]
+        if superseded:
+            await asyncio.get_running_loop().run_in_executor(
+                _io_executor, drop_superseded_attempts, session["username"], superseded
+            )
         return {"message": f"Session {session_id} cleaned up successfully"}
     
     return {"message": "Session not found or already cleaned"}
@@ -665,23 +1206,20 @@ async def resume_test(request: dict):
     
     # Reset start time to current time
     session["time_started"] = datetime.now()
+    session["time_started_iso"] = session["time_started"].isoformat()
+    session["started_monotonic"] = time.monotonic()
     session.pop("paused_at", None)
     session["is_paused"] = False
     
-    # Save sessions to disk
-    save_active_sessions()
-    
-    # Restart auto-save
-    asyncio.create_task(auto_save_session(session_id))
+    # Save sessions to disk (auto-save resumes now that it is no longer paused)
+    _sessions_dirty.set()
     
     return {"message": "Test resumed successfully"}
 
 @app.get("/api/user-stats/{username}")
 async def get_user_stats(username: str):
     """Get user's progress statistics"""
-    excel_file = USER_DATA_DIR / f"{username}_progress.xlsx"
-    
-    if not excel_file.exists():
+    if not has_user_progress(username):
         # Return default stats if no data exists
         return {
             "total_time": 0,
@@ -692,75 +1230,34 @@ async def get_user_stats(username: str):
         }
     
     try:
-        # Read Excel file and calculate statistics
-        df = pd.read_excel(excel_file, sheet_name=None)  # Read all sheets
-        
-        total_time = 0
-        test_scores = []  # Store individual test scores (actual marks)
-        latest_attempts = {}  # Store latest attempt per test
+        stats = load_user_stats(username)
+        if stats is None:
+            stats = await asyncio.get_running_loop().run_in_executor(_io_executor, migrate_user_stats, username)
         
-        # First, identify latest attempt for each test
-        for sheet_name, sheet_data in df.items():
-            if not sheet_data.empty and 'Test_Name' in sheet_data.columns:
-                test_name = sheet_data['Test_Name'].iloc[0]
-                attempt_timestamp = sheet_name  # Sheet name contains timestamp
-                
-                if test_name not in latest_attempts or attempt_timestamp > latest_attempts[test_name]['timestamp']:
-                    latest_attempts[test_name] = {
-                        'timestamp': attempt_timestamp,
-                        'sheet_name': sheet_name,
-                        'data': sheet_data
-                    }
-        
-        # Calculate stats only from latest attempts
-        for test_name, attempt_info in latest_attempts.items():
-            sheet_data = attempt_info['data']
-            
-            # Calculate time spent
-            if 'Time_Spent' in sheet_data.columns:
-                total_time += sheet_data['Time_Spent'].sum()
-            
-            # Calculate actual CAT score using marks
-            if 'Marks_Obtained' in sheet_data.columns:
-                test_score = sheet_data['Marks_Obtained'].sum()
-                test_scores.append(test_score)
-            elif 'Total_Score' in sheet_data.columns:
-                # Fallback: get total score from the last row
-                total_score_values = sheet_data['Total_Score'].dropna()
-                if not total_score_values.empty:
-                    test_score = total_score_values.iloc[-1]
-                    test_scores.append(test_score)
+        # Stats only count the latest attempt of each test
+        latest_attempts = stats.get("tests", {})
+        total_time = sum(attempt["time"] or 0 for attempt in latest_attempts.values())
+        test_scores = [attempt["score"] for attempt in latest_attempts.values() if attempt["score"] is not None]
         
         # Calculate average score (mean of actual marks obtained)
         average_score = sum(test_scores) / len(test_scores) if test_scores else 0
         tests_completed = len(latest_attempts)
         
         # Calculate overall totals for additional info (from latest attempts only)
-        total_questions_attempted = sum(len(attempt_info['data']) for attempt_info in latest_attempts.values())
-        total_correct_answers = sum(
-            (attempt_info['data']['User_Answer'] == attempt_info['data']['Correct_Answer']).sum() 
-            for attempt_info in latest_attempts.values() 
-            if 'User_Answer' in attempt_info['data'].columns and 'Correct_Answer' in attempt_info['data'].columns
-        )
+        total_questions_attempted = sum(attempt["questions"] for attempt in latest_attempts.values())
+        total_correct_answers = sum(attempt["correct"] for attempt in latest_attempts.values())
         
-        # Get last test date from the most recent sheet
-        last_test_date = None
-        if df:
-            latest_sheet = max(df.keys())  # Assuming sheet names are sortable by date
-            if 'Attempt_Timestamp' in df[latest_sheet].columns:
-                timestamps = df[latest_sheet]['Attempt_Timestamp'].dropna()
-                if not timestamps.empty:
-                    last_test_date = timestamps.iloc[0]
+        last_test_date = stats.get("last_test_date")
         
         return {
-            "total_time": int(total_time) if hasattr(total_time, 'item') else int(total_time),
-            "tests_completed": int(tests_completed) if hasattr(tests_completed, 'item') else int(tests_completed),
-            "average_score": float(round(average_score, 1)) if hasattr(average_score, 'item') else float(round(average_score, 1)),
-            "total_attempts": len(df.keys()) if df else 0,  # Total attempts (including retakes)
-            "unique_tests_taken": int(tests_completed) if hasattr(tests_completed, 'item') else int(tests_completed),  # Unique tests
+            "total_time": int(total_time),
+            "tests_completed": int(tests_completed),
+            "average_score": float(round(average_score, 1)),
+            "total_attempts": stats.get("total_attempts", 0),  # Total attempts (including retakes)
+            "unique_tests_taken": int(tests_completed),  # Unique tests
             "last_test_date": str(last_test_date) if last_test_date else None,
-            "total_questions_attempted": int(total_questions_attempted) if hasattr(total_questions_attempted, 'item') else int(total_questions_attempted),
-            "total_correct_answers": int(total_correct_answers) if hasattr(total_correct_answers, 'item') else int(total_correct_answers),
+            "total_questions_attempted": int(total_questions_attempted),
+            "total_correct_answers": int(total_correct_answers),
             "individual_test_scores": [float(round(score, 1)) for score in test_scores],
             "max_possible_score": 198,  # 66 questions × 3 marks = 198
             "calculation_method": "CAT_marking_latest_attempts_only"
@@ -776,18 +1273,40 @@ async def get_user_stats(username: str):
             "last_test_date": None
         }
 
+def build_progress_workbook(username: str) -> bytes:
+    """Bundle every attempt back into one workbook, one sheet per attempt"""
+    import pandas as pd
+    
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        for sheet_name, sheet_data in load_user_attempts(username).items():
+            sheet_data.to_excel(writer, sheet_name=sheet_name[:31], index=False)
+    return buffer.getvalue()
+
 @app.get("/api/user-progress/{username}")
 async def get_user_progress(username: str):
     """Get user's test progress and download Excel file"""
-    excel_file = USER_DATA_DIR / f"{username}_progress.xlsx"
-    
-    if not excel_file.exists():
+    if not has_user_progress(username):
         raise HTTPException(status_code=404, detail="No progress data found for user")
     
-    return FileResponse(
-        path=excel_file,
-        filename=f"{username}_progress.xlsx",
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    legacy_file = legacy_progress_file(username)
+    if not has_attempts_since_legacy(username):
+        # Passing the stat result saves Starlette a second stat() and fills in
+        # Content-Length / Last-Modified / ETag up front
+        return FileResponse(
+            path=legacy_file,
+            filename=f"{username}_progress.xlsx",
+            media_type=XLSX_MEDIA_TYPE,
+            stat_result=legacy_file.stat()
+        )
+    
+    # Reading every attempt and writing the workbook can take seconds; keep it off the event loop
+    content = await asyncio.get_running_loop().run_in_executor(_io_executor, build_progress_workbook, username)
+    
+    return Response(
+        content=content,
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{username}_progress.xlsx"'}
     )
 
 # Mount static files
@@ -797,6 +1316,80 @@ app.mount("/static", StaticFiles(directory="frontend"), name="static")
 def handler(request):
     return app(request)
 
+SECTIONS = ("VARC", "DILR", "QA")
+
+def section_score_totals(df: "pd.DataFrame") -> Dict[str, int]:
+    """Sum Marks_Obtained per section (all three sections always present)"""
+    if df.empty or 'Section' not in df.columns or 'Marks_Obtained' not in df.columns:
+        return {section: 0 for section in SECTIONS}
+    sums = df.groupby('Section', sort=False)['Marks_Obtained'].sum()
+    return {section: int(sums.get(section, 0)) for section in SECTIONS}
+
+def _attempt_sources_version(username: str) -> tuple:
+    """Versions of every file load_latest_user_attempt may read (None when absent)"""
+    attempt_files = user_attempt_files(username)
+    latest_file = attempt_files[-1] if attempt_files else None
+    return (
+        _file_version(user_attempts_csv(username)),
+        latest_file and (latest_file.name, _file_version(latest_file)),
+        _file_version(legacy_progress_file(username)),
+    )
+
+def build_ai_performance_data(username: str):
+    """Summarise a user's latest attempt into the payload the AI analysis expects.
+    
+    Returns (user_performance_data, section_max_scores). The result is cached
+    until one of the user's attempt files changes; treat it as read-only.
+    """
+    return _build_ai_performance_data(username, _attempt_sources_version(username))
+
+@lru_cache(maxsize=128)
+def _build_ai_performance_data(username: str, sources_version: tuple):
+    # sources_version only keys the cache
+    # Load only the latest test performance (most recent sheet)
+    latest = load_latest_user_attempt(username)
+    
+    if latest is None:
+        raise HTTPException(status_code=404, detail="No test data found")
+    
+    latest_sheet, latest_df = latest
+    
+    if latest_df.empty:
+        raise HTTPException(status_code=404, detail="Test data is empty")
+    
+    
+    # Get dynamic question counts for max scores (3 marks per question)
+    test_name = latest_sheet.split('_')[0] if '_' in latest_sheet else "Unknown"
+    section_max_scores = section_max_marks(test_name)
+    
+    # Calculate section-wise scores and marks
+    section_scores = section_score_totals(latest_df)
+    
+    total_score = sum(section_scores.values())
+    
+    # Enhanced data preparation for AI analysis
+    question_records = latest_df.to_dict('records')
+    
+    question_arrays = _question_arrays(latest_df)
+    
+    # Calculate detailed time analysis
+    time_data = calculate_detailed_time_analysis(question_arrays)
+    
+    # Calculate performance insights
+    performance_insights = calculate_performance_insights(question_arrays, section_scores)
+    
+    user_performance_data = {
+        "username": username,
+        "test_name": latest_sheet.split('_')[0] if '_' in latest_sheet else "Unknown",
+        "section_scores": section_scores,
+        "total_score": total_score,
+        "question_data": question_records,
+        "time_analysis": time_data,
+        "performance_insights": performance_insights
+    }
+    
+    return user_performance_data, section_max_scores
+
 @app.get("/api/ai-analysis/{username}")
 async def get_ai_analysis(username: str):
     """Get AI-powered performance analysis for a user"""
@@ -807,82 +1400,15 @@ async def get_ai_analysis(username: str):
             "basic_analysis": "Enable AI features with OpenAI API key or local LLM for detailed insights."
         }
     
-    excel_file = USER_DATA_DIR / f"{username}_progress.xlsx"
-    
-    if not excel_file.exists():
+    if not has_user_progress(username):
         raise HTTPException(status_code=404, detail="No test data found for user")
     
     try:
-        # Load Excel data to get latest test performance
-        df_dict = {}
-        
-        with pd.ExcelFile(excel_file) as xl_file:
-            for sheet_name in xl_file.sheet_names:
-                df_dict[sheet_name] = pd.read_excel(xl_file, sheet_name=sheet_name)
-        
-        if not df_dict:
-            raise HTTPException(status_code=404, detail="No test data found")
-        
-        # Get the latest test data (most recent sheet)
-        latest_sheet = max(df_dict.keys())
-        latest_df = df_dict[latest_sheet]
-        
-        if latest_df.empty:
-            raise HTTPException(status_code=404, detail="Test data is empty")
-        
-        # Calculate section-wise scores and marks
-        section_scores = {"VARC": 0, "DILR": 0, "QA": 0}
-        
-        # Get dynamic question counts for max scores (3 marks per question)
-        test_data = load_test_data()
-        test_name = latest_sheet.split('_')[0] if '_' in latest_sheet else "Unknown"
-        
-        # Find the test data for this specific test
-        current_test = None
-        for test in test_data:
-            if test["name"] == test_name:
-                current_test = test
-                break
-        
-        if current_test:
-            varc_count = sum(len(q["qa_list"]) for q in current_test["data"]["VARC"])
-            dilr_count = sum(len(q["qa_list"]) for q in current_test["data"]["DILR"])
-            qa_count = sum(len(q["qa_list"]) for q in current_test["data"]["QA"])
-            section_max_scores = {
-                "VARC": varc_count * 3,
-                "DILR": dilr_count * 3,
-                "QA": qa_count * 3
-            }
-        else:
-            # Fallback to default values
-            section_max_scores = {"VARC": 72, "DILR": 60, "QA": 66}
-        
-        for _, row in latest_df.iterrows():
-            section = row.get('Section', '')
-            marks = row.get('Marks_Obtained', 0)
-            if section in section_scores:
-                section_scores[section] += marks
-        
-        total_score = sum(section_scores.values())
-        
-        # Enhanced data preparation for AI analysis
-        question_records = latest_df.to_dict('records')
-        
-        # Calculate detailed time analysis
-        time_data = calculate_detailed_time_analysis(question_records)
-        
-        # Calculate performance insights
-        performance_insights = calculate_performance_insights(question_records, section_scores)
-        
-        user_performance_data = {
-            "username": username,
-            "test_name": latest_sheet.split('_')[0] if '_' in latest_sheet else "Unknown",
-            "section_scores": section_scores,
-            "total_score": total_score,
-            "question_data": question_records,
-            "time_analysis": time_data,
-            "performance_insights": performance_insights
-        }
+        user_performance_data, section_max_scores = await asyncio.get_running_loop().run_in_executor(
+            _io_executor, build_ai_performance_data, username
+        )
+        section_scores = user_performance_data["section_scores"]
+        total_score = user_performance_data["total_score"]
         
         # Generate analysis
         if is_ai_available():
@@ -916,6 +1442,32 @@ async def get_ai_analysis(username: str):
         raise HTTPException(status_code=500, detail=f"Analysis generation failed: {str(e)}")
 
 
+@app.get("/api/ai-analysis/{username}/stream")
+async def stream_ai_analysis(username: str):
+    """Stream the performance analysis as markdown while it is being generated"""
+    if not AI_ANALYSIS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="AI analysis module not available. Please check dependencies.")
+    
+    if not has_user_progress(username):
+        raise HTTPException(status_code=404, detail="No test data found for user")
+    
+    try:
+        user_performance_data, _ = await asyncio.get_running_loop().run_in_executor(
+            _io_executor, build_ai_performance_data, username
+        )
+    except Exception as e:
+        print(f"Error in AI analysis for {username}: {e}")
+        raise HTTPException(status_code=500, detail=f"Analysis generation failed: {str(e)}")
+    
+    test_name = user_performance_data.get("test_name", "Unknown")
+    if is_ai_available():
+        chunks = analyze_user_performance_stream(user_performance_data, test_name)
+    else:
+        chunks = iter([generate_basic_analysis(user_performance_data["section_scores"], user_performance_data["total_score"], test_name)])
+    
+    return StreamingResponse(chunks, media_type="text/markdown; charset=utf-8")
+
+
 @app.post("/api/ai-followup")
 async def ai_followup_question(request: dict):
     """Handle follow-up questions about the AI analysis"""
@@ -933,58 +1485,17 @@ async def ai_followup_question(request: dict):
     
     try:
         # Get user's latest test data for context
-        excel_file = USER_DATA_DIR / f"{username}_progress.xlsx"
-        
-        if not excel_file.exists():
+        if not has_user_progress(username):
             raise HTTPException(status_code=404, detail="No test data found for user")
         
-        # Load latest test data for context
-        df_dict = {}
-        with pd.ExcelFile(excel_file) as xl_file:
-            for sheet_name in xl_file.sheet_names:
-                df_dict[sheet_name] = pd.read_excel(xl_file, sheet_name=sheet_name)
-        
-        if not df_dict:
-            raise HTTPException(status_code=404, detail="No test data found")
-        
-        latest_sheet = max(df_dict.keys())
-        latest_df = df_dict[latest_sheet]
-        
-        # Calculate basic performance context
-        section_scores = {"VARC": 0, "DILR": 0, "QA": 0}
-        for _, row in latest_df.iterrows():
-            section = row.get('Section', '')
-            marks = row.get('Marks_Obtained', 0)
-            if section in section_scores:
-                section_scores[section] += marks
-        
-        total_score = sum(section_scores.values())
-        
-        # Get dynamic question counts for max scores
-        test_data = load_test_data()
-        test_name = latest_sheet.split('_')[0] if '_' in latest_sheet else "Unknown"
-        
-        # Find the test data for this specific test
-        current_test = None
-        for test in test_data:
-            if test["name"] == test_name:
-                current_test = test
-                break
-        
-        if current_test:
-            varc_count = sum(len(q["qa_list"]) for q in current_test["data"]["VARC"])
-            dilr_count = sum(len(q["qa_list"]) for q in current_test["data"]["DILR"])
-            qa_count = sum(len(q["qa_list"]) for q in current_test["data"]["QA"])
-            max_scores = {
-                "VARC": varc_count * 3,
-                "DILR": dilr_count * 3,
-                "QA": qa_count * 3
-            }
-            total_max = sum(max_scores.values())
-        else:
-            # Fallback to default values
-            max_scores = {"VARC": 72, "DILR": 60, "QA": 66}
-            total_max = 198
+        # Reuse the cached summary of the latest attempt
+        user_performance_data, max_scores = await asyncio.get_running_loop().run_in_executor(
+            _io_executor, build_ai_performance_data, username
+        )
+        section_scores = user_performance_data["section_scores"]
+        total_score = user_performance_data["total_score"]
+        test_name = user_performance_data["test_name"]
+        total_max = sum(max_scores.values())
         
         # Create context for the AI
         context = f"""
@@ -1068,53 +1579,47 @@ async def download_test_report(username: str):
     
     # First check if user has an active session - use that for the most current data
     current_session_data = None
-    for session_id, session in active_sessions.items():
-        if session.get("username") == username and not session.get("is_paused", False):
+    just_saved = None
+    for session_id, session in iter_user_sessions(username):
+        if not session.get("is_paused", False):
             current_session_data = session
-            # Save the current session to Excel first
-            print(f"Found active session for {username}, saving current data...")
-            await save_session_data(session_id)
+            # Save the current session first, unless nothing changed since the last save
+            if session_is_dirty(session):
+                print(f"Found active session for {username}, saving current data...")
+                just_saved = await save_session_data(session_id)
             break
     
-    excel_file = USER_DATA_DIR / f"{username}_progress.xlsx"
-    
-    if not excel_file.exists():
+    if not has_user_progress(username):
         raise HTTPException(status_code=404, detail="No test data found for user")
     
     try:
-        # Load the latest test data
-        df_dict = {}
-        with pd.ExcelFile(excel_file) as xl_file:
-            for sheet_name in xl_file.sheet_names:
-                df_dict[sheet_name] = pd.read_excel(xl_file, sheet_name=sheet_name)
+        # Use the attempt just saved as is; otherwise load the latest one from disk
+        if just_saved is not None:
+            import pandas as pd
+            latest = just_saved[0], pd.DataFrame(just_saved[1])
+        else:
+            latest = await asyncio.get_running_loop().run_in_executor(_io_executor, load_latest_user_attempt, username)
         
-        if not df_dict:
+        if latest is None:
             raise HTTPException(status_code=404, detail="No test data found")
         
         # Get the latest test
-        latest_sheet = max(df_dict.keys())
-        latest_df = df_dict[latest_sheet]
+        latest_sheet, latest_df = latest
         test_name = latest_sheet.split('_')[0] if '_' in latest_sheet else "CAT Mock Test"
         
         # Load the original test data for questions and solutions
-        with open(DATA_DIR / "full_data.json", 'r') as f:
-            full_test_data = json.load(f)
+        full_test_data = load_test_data()
         
-        # Find the matching test data (try exact match first, then partial match)
-        test_data = None
-        for test in full_test_data:
-            if test["name"] == test_name:
-                test_data = test
-                break
+        # Find the matching test data (exact name, then ignoring '-'/'_' and case)
+        tests_by_name, tests_by_normalized = _test_name_index()
+        test_data = tests_by_name.get(test_name) or tests_by_normalized.get(_normalize_test_name(test_name))
         
-        # If no exact match, try partial matching
+        # If no match, try partial matching
         if not test_data:
+            test_name_lower = test_name.lower()
             for test in full_test_data:
-                # Try matching with common variations
-                test_json_name = test["name"]
-                if (test_name.lower() in test_json_name.lower() or 
-                    test_json_name.lower() in test_name.lower() or
-                    test_name.replace("-", "").replace("_", "").lower() == test_json_name.replace("-", "").replace("_", "").lower()):
+                test_json_name = test["name"].lower()
+                if test_name_lower in test_json_name or test_json_name in test_name_lower:
                     test_data = test
                     break
         
@@ -1127,22 +1632,16 @@ async def download_test_report(username: str):
         if not test_data:
             raise HTTPException(status_code=404, detail="No test data available in the system")
         
-        # Generate PDF
-        pdf_buffer = BytesIO()
-        pdf_content = generate_comprehensive_pdf_report(
-            username, latest_df, test_data, test_name
+        # Generate PDF (reportlab layout is CPU-bound; keep it off the event loop)
+        pdf_content = await asyncio.get_running_loop().run_in_executor(
+            _io_executor, generate_comprehensive_pdf_report, username, latest_df, test_data, test_name
         )
         
-        pdf_buffer.write(pdf_content)
-        pdf_buffer.seek(0)
-        
         # Return PDF as response
-        from fastapi.responses import Response
-        
         filename = f"CAT_Test_Report_{username}_{test_name}_{datetime.now().strftime('%Y%m%d')}.pdf"
         
         return Response(
-            content=pdf_buffer.getvalue(),
+            content=pdf_content,
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"attachment; filename={filename}"
@@ -1154,6 +1653,13 @@ async def download_test_report(username: str):
         raise HTTPException(status_code=500, detail=f"Failed to generate PDF report: {str(e)}")
 
 
+# clean_html_text runs for every question, option and solution in a report
+_RE_FRAC = re.compile(r'\\frac\{([^}]+)\}\{([^}]+)\}')
+_RE_SQRT = re.compile(r'\\sqrt\{([^}]+)\}')
+_RE_LATEX_ARG = re.compile(r'\\[a-zA-Z]+\{([^}]*)\}')
+_RE_LATEX_CMD = re.compile(r'\\[a-zA-Z]+')
+_RE_HTML_TAG = re.compile(r'<[^>]+>')
+
 def clean_html_text(html_text):
     """Clean HTML tags and entities from text for PDF display, with basic LaTeX formatting"""
     if not html_text:
@@ -1165,10 +1671,10 @@ def clean_html_text(html_text):
     # Basic LaTeX to readable format conversions (safe, simple ones only)
     try:
         # Fractions: \frac{a}{b} -> (a/b)
-        text = re.sub(r'\\frac\{([^}]+)\}\{([^}]+)\}', r'(\1/\2)', text)
+        text = _RE_FRAC.sub(r'(\1/\2)', text)
         
         # Square roots: \sqrt{x} -> √(x)
-        text = re.sub(r'\\sqrt\{([^}]+)\}', r'√(\1)', text)
+        text = _RE_SQRT.sub(r'√(\1)', text)
         
         # Mathematical symbols
         text = text.replace(r'\times', '×')
@@ -1177,22 +1683,17 @@ def clean_html_text(html_text):
         text = text.replace(r'\pi', 'π')
         
         # Remove remaining LaTeX commands (keep the content) - safe approach
-        text = re.sub(r'\\[a-zA-Z]+\{([^}]*)\}', r'\1', text)
-        text = re.sub(r'\\[a-zA-Z]+', '', text)
+        text = _RE_LATEX_ARG.sub(r'\1', text)
+        text = _RE_LATEX_CMD.sub('', text)
     except:
         # If any LaTeX processing fails, continue with original text
         pass
     
     # Remove HTML tags
-    clean_text = re.sub(r'<[^>]+>', '', text)
+    clean_text = _RE_HTML_TAG.sub('', text)
     
-    # Replace common HTML entities
-    clean_text = clean_text.replace('&nbsp;', ' ')
-    clean_text = clean_text.replace('&amp;', '&')
-    clean_text = clean_text.replace('&lt;', '<')
-    clean_text = clean_text.replace('&gt;', '>')
-    clean_text = clean_text.replace('&quot;', '"')
-    clean_text = clean_text.replace('&#39;', "'")
+    # Decode HTML entities (&nbsp; becomes a no-break space, folded below)
+    clean_text = html.unescape(clean_text)
     
     # Clean up whitespace
     clean_text = ' '.join(clean_text.split())
@@ -1200,8 +1701,18 @@ def clean_html_text(html_text):
     return clean_text
 
 
+# Read-only default for answers whose question is missing from the test data
+_NO_QUESTION_DATA: Dict[str, Any] = {}
+
 def generate_comprehensive_pdf_report(username, test_df, test_data, test_name):
     """Generate comprehensive PDF report with all question details"""
+    import pandas as pd
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.lib.enums import TA_CENTER
     
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
@@ -1254,32 +1765,30 @@ def generate_comprehensive_pdf_report(username, test_df, test_data, test_name):
     story.append(Spacer(1, 0.3*inch))
     
     # Calculate performance summary
-    section_scores = {"VARC": 0, "DILR": 0, "QA": 0}
+    section_scores = section_score_totals(test_df)
     
     # Get dynamic question counts
-    varc_count = sum(len(q["qa_list"]) for q in test_data["VARC"])
-    dilr_count = sum(len(q["qa_list"]) for q in test_data["DILR"])
-    qa_count = sum(len(q["qa_list"]) for q in test_data["QA"])
+    question_counts = dict(_section_question_counts(test_data["name"]))
+    varc_count = question_counts["VARC"]
+    dilr_count = question_counts["DILR"]
+    qa_count = question_counts["QA"]
     
     section_stats = {"VARC": {"attempted": 0, "correct": 0, "total": varc_count}, 
                      "DILR": {"attempted": 0, "correct": 0, "total": dilr_count}, 
                      "QA": {"attempted": 0, "correct": 0, "total": qa_count}}
     
-    for _, row in test_df.iterrows():
-        section = row.get('Section', '')
-        marks = row.get('Marks_Obtained', 0)
-        user_answer = row.get('User_Answer', '')
-        correct_answer = row.get('Correct_Answer', '')
-        
-        if section in section_scores:
-            # Always add marks (including negative marks and zeros)
-            section_scores[section] += marks
-            
-            # Only count as attempted if there's a real answer
-            if user_answer and str(user_answer).strip() != '' and str(user_answer).strip() != 'nan':
-                section_stats[section]["attempted"] += 1
-                if str(user_answer).strip().lower() == str(correct_answer).strip().lower():
-                    section_stats[section]["correct"] += 1
+    if not test_df.empty and {'Section', 'User_Answer', 'Correct_Answer'} <= set(test_df.columns):
+        # Only count as attempted if there's a real answer
+        user_answers = test_df['User_Answer']
+        user_text = user_answers.fillna('').astype(str).str.strip()
+        attempted = user_answers.fillna('').astype(bool) & (user_text != '') & (user_text != 'nan')
+        correct_text = test_df['Correct_Answer'].fillna('').astype(str).str.strip()
+        correct = attempted & (user_text.str.lower() == correct_text.str.lower())
+        counts = pd.DataFrame({'attempted': attempted, 'correct': correct}).groupby(test_df['Section']).sum()
+        for section in section_stats:
+            if section in counts.index:
+                section_stats[section]["attempted"] = int(counts.at[section, 'attempted'])
+                section_stats[section]["correct"] = int(counts.at[section, 'correct'])
     
     total_score = sum(section_scores.values())
     total_attempted = sum(stats["attempted"] for stats in section_stats.values())
@@ -1326,13 +1835,7 @@ def generate_comprehensive_pdf_report(username, test_df, test_data, test_name):
         for group in section_data:
             if group.get("qa_list"):
                 for question in group["qa_list"]:
-                    # Create question ID based on section and question number
-                    question_num = question.get("question_num")
-                    if isinstance(question_num, list):
-                        question_num = question_num[0]
-                    question_id = f"{section_name}_{question_num}"
-                    
-                    question_map[question_id] = {
+                    question_map[make_question_id(section_name, question)] = {
                         "question": question.get("question", ""),
                         "context": group.get("context", ""),
                         "options": question.get("options"),
@@ -1346,14 +1849,16 @@ def generate_comprehensive_pdf_report(username, test_df, test_data, test_name):
     
     # Sort by section order
     section_order = {"VARC": 1, "DILR": 2, "QA": 3}
-    sorted_df = test_df.sort_values(by=['Section', 'Question_ID'], key=lambda x: x.map(lambda val: (section_order.get(val.split('_')[0], 4), val) if isinstance(val, str) and '_' in val else (4, val)))
+    sorted_df = (
+        test_df.assign(_sec_order=test_df['Section'].map(section_order).fillna(4).astype('int8'))
+        .sort_values(['_sec_order', 'Question_ID'], kind='stable')
+        .drop(columns='_sec_order')
+    )
     
     # Filter to only show answered questions in PDF
-    answered_questions_df = sorted_df[
-        (sorted_df['User_Answer'].notna()) & 
-        (sorted_df['User_Answer'].astype(str).str.strip() != '') & 
-        (sorted_df['User_Answer'].astype(str).str.strip() != 'nan')
-    ]
+    user_text = sorted_df['User_Answer'].astype('string').str.strip()
+    answered = user_text.notna() & (user_text != '') & (user_text != 'nan')
+    answered_questions_df = sorted_df[answered.fillna(False).astype(bool)]
     
     if answered_questions_df.empty:
         story.append(Paragraph("No questions were answered in this test.", normal_style))
@@ -1361,17 +1866,33 @@ def generate_comprehensive_pdf_report(username, test_df, test_data, test_name):
         story.append(Paragraph(f"Showing {len(answered_questions_df)} answered questions out of {len(sorted_df)} total questions.", normal_style))
         story.append(Spacer(1, 0.2*inch))
     
-    for _, row in answered_questions_df.iterrows():
-        question_id = row.get('Question_ID', '')
-        section = row.get('Section', '')
-        user_answer = row.get('User_Answer', '')
-        correct_answer = row.get('Correct_Answer', '')
-        marks_obtained = row.get('Marks_Obtained', 0)
-        question_type = row.get('Question_Type', '')
-        
-        # Skip if still somehow empty (extra safety)
-        if not user_answer or str(user_answer).strip() == '' or str(user_answer).strip() == 'nan':
-            continue
+    # Question header styles: green for correct answers, red for incorrect ones
+    correct_header_style = ParagraphStyle(
+        'CorrectQuestionHeader',
+        parent=subheading_style,
+        textColor=colors.green,
+        fontSize=12,
+        spaceAfter=8,
+        spaceBefore=10
+    )
+    incorrect_header_style = ParagraphStyle(
+        'IncorrectQuestionHeader', 
+        parent=subheading_style,
+        textColor=colors.red,
+        fontSize=12,
+        spaceAfter=8,
+        spaceBefore=10
+    )
+    
+    # Iterate only the columns the loop reads
+    detail_df = answered_questions_df.filter(items=['Question_ID', 'Section', 'User_Answer', 'Correct_Answer', 'Marks_Obtained', 'Question_Type'])
+    for row in detail_df.itertuples(index=False):
+        question_id = getattr(row, 'Question_ID', '')
+        section = getattr(row, 'Section', '')
+        user_answer = getattr(row, 'User_Answer', '')
+        correct_answer = getattr(row, 'Correct_Answer', '')
+        marks_obtained = getattr(row, 'Marks_Obtained', 0)
+        question_type = getattr(row, 'Question_Type', '')
         
         # Section header
         if section != current_section:
@@ -1386,31 +1907,15 @@ def generate_comprehensive_pdf_report(username, test_df, test_data, test_name):
             story.append(Paragraph(f"{section_full_name} ({section})", heading_style))
         
         # Get question data
-        question_data = question_map.get(question_id, {})
+        question_data = question_map.get(question_id, _NO_QUESTION_DATA)
         
         # Question header with status and color coding
         if marks_obtained > 0:
             status = "✓ Correct"
-            # Create green style for correct answers
-            question_header_style = ParagraphStyle(
-                'CorrectQuestionHeader',
-                parent=subheading_style,
-                textColor=colors.green,
-                fontSize=12,
-                spaceAfter=8,
-                spaceBefore=10
-            )
+            question_header_style = correct_header_style
         elif user_answer and str(user_answer).strip():
             status = "✗ Incorrect"  
-            # Create red style for incorrect answers
-            question_header_style = ParagraphStyle(
-                'IncorrectQuestionHeader', 
-                parent=subheading_style,
-                textColor=colors.red,
-                fontSize=12,
-                spaceAfter=8,
-                spaceBefore=10
-            )
+            question_header_style = incorrect_header_style
         else:
             status = "— Not Attempted"
             # Use normal style for not attempted
@@ -1434,16 +1939,18 @@ def generate_comprehensive_pdf_report(username, test_df, test_data, test_name):
         # Options for MCQ
         if question_data.get("options") and question_type == "Multiple Choice Question":
             story.append(Paragraph("<b>Options:</b>", normal_style))
+            user_choice = str(user_answer).strip().lower()
+            correct_choice = str(correct_answer).strip().lower()
             for i, option in enumerate(question_data["options"]):
-                option_letter = chr(ord('a') + i)
+                option_letter = chr(ord('a') + i)  # already lowercase
                 option_text = clean_html_text(option)
                 
                 prefix = ""
-                if str(user_answer).strip().lower() == option_letter.lower() and str(correct_answer).strip().lower() == option_letter.lower():
+                if user_choice == option_letter and correct_choice == option_letter:
                     prefix = "✓ [Your Choice - Correct] "
-                elif str(user_answer).strip().lower() == option_letter.lower():
+                elif user_choice == option_letter:
                     prefix = "✗ [Your Choice - Incorrect] "
-                elif str(correct_answer).strip().lower() == option_letter.lower():
+                elif correct_choice == option_letter:
                     prefix = "✓ [Correct Answer] "
                 
                 story.append(Paragraph(f"   {option_letter}) {prefix}{option_text}", normal_style))
@@ -1470,37 +1977,59 @@ def generate_comprehensive_pdf_report(username, test_df, test_data, test_name):
     return buffer.getvalue()
 
 
-def calculate_detailed_time_analysis(question_records: list) -> dict:
+def _question_arrays(df: "pd.DataFrame") -> Dict[str, Any]:
+    """Per-question numpy columns shared by the time and insight summaries.
+    
+    section_code indexes SECTIONS (-1 for anything else).
+    """
+    import numpy as np
+    import pandas as pd
+    
+    def column(name, default):
+        return df[name] if name in df.columns else pd.Series(default, index=df.index, dtype=object)
+    
+    user_text = column('User_Answer', '').fillna('').astype(str).str.strip()
+    correct_text = column('Correct_Answer', '').astype(str).str.strip()
+    attempted = ((user_text != '') & (user_text != 'nan')).to_numpy()
+    return {
+        "section_code": column('Section', '').map({s: i for i, s in enumerate(SECTIONS)}).fillna(-1).to_numpy(np.int8),
+        "time_spent": column('Time_Spent', 0).to_numpy(),
+        "attempted": attempted,
+        "correct": attempted & (user_text.str.lower() == correct_text.str.lower()).to_numpy(),
+        "is_mcq": column('Question_Type', '').astype(str).str.contains('Multiple Choice', regex=False).to_numpy(),
+    }
+
+def _per_section(section_code, mask, weights=None) -> list:
+    """Count (or sum weights) of masked questions for each entry of SECTIONS"""
+    import numpy as np
+    keep = mask & (section_code >= 0)
+    if weights is None:
+        return np.bincount(section_code[keep], minlength=len(SECTIONS)).tolist()
+    totals = np.bincount(section_code[keep], weights=weights[keep], minlength=len(SECTIONS))
+    # keep integer seconds integral, as the summed Python values would be
+    return (totals.astype(np.int64) if weights.dtype.kind in 'iu' else totals).tolist()
+
+def calculate_detailed_time_analysis(arrays: Dict[str, Any]) -> dict:
     """Calculate detailed time analysis from question data"""
-    if not question_records:
+    time_spent = arrays["time_spent"]
+    if not len(time_spent):
         return {"total_time": 0, "avg_per_question": 0, "section_times": {}}
     
-    section_times = {"VARC": [], "DILR": [], "QA": []}
-    total_time = 0
-    attempted_count = 0
-    
-    for record in question_records:
-        time_spent = record.get('Time_Spent', 0)
-        section = record.get('Section', '')
-        user_answer = record.get('User_Answer', '')
-        
-        if time_spent > 0:
-            total_time += time_spent
-            if section in section_times:
-                section_times[section].append(time_spent)
-            
-            if user_answer and str(user_answer).strip():
-                attempted_count += 1
+    timed = time_spent > 0
+    total_time = time_spent[timed].sum().item()
+    attempted_count = int((timed & arrays["attempted"]).sum())
     
     # Calculate averages
     avg_per_question = total_time / attempted_count if attempted_count > 0 else 0
     
+    section_totals = _per_section(arrays["section_code"], timed, time_spent)
+    section_counts = _per_section(arrays["section_code"], timed)
     section_averages = {}
-    for section, times in section_times.items():
+    for section, section_total, count in zip(SECTIONS, section_totals, section_counts):
         section_averages[section] = {
-            "total_time": sum(times),
-            "avg_time": sum(times) / len(times) if times else 0,
-            "questions_with_time": len(times)
+            "total_time": section_total,
+            "avg_time": section_total / count if count else 0,
+            "questions_with_time": count
         }
     
     return {
@@ -1512,7 +2041,7 @@ def calculate_detailed_time_analysis(question_records: list) -> dict:
         "attempted_count": attempted_count
     }
 
-def calculate_performance_insights(question_records: list, section_scores: dict) -> dict:
+def calculate_performance_insights(arrays: Dict[str, Any], section_scores: dict) -> dict:
     """Calculate detailed performance insights"""
     insights = {
         "section_analysis": {"VARC": {}, "DILR": {}, "QA": {}},
@@ -1522,7 +2051,7 @@ def calculate_performance_insights(question_records: list, section_scores: dict)
     }
     
     # Initialize all sections properly
-    for section in ["VARC", "DILR", "QA"]:
+    for section in SECTIONS:
         insights["section_analysis"][section] = {
             "attempted": 0, 
             "correct": 0, 
@@ -1532,34 +2061,27 @@ def calculate_performance_insights(question_records: list, section_scores: dict)
             "avg_time_per_question": 0
         }
     
-    if not question_records:
+    section_code = arrays["section_code"]
+    if not len(section_code):
         return insights
     
-    for record in question_records:
-        section = record.get('Section', '')
-        question_type = record.get('Question_Type', '')
-        user_answer = record.get('User_Answer', '')
-        correct_answer = record.get('Correct_Answer', '')
-        time_spent = record.get('Time_Spent', 0)
-        
-        # Only process valid sections
-        if section not in insights["section_analysis"]:
-            continue
-            
-        # Track attempts and correctness
-        if user_answer and str(user_answer).strip():
-            insights["section_analysis"][section]["attempted"] += 1
-            insights["section_analysis"][section]["total_time"] += time_spent
-            
-            is_correct = str(user_answer).strip().lower() == str(correct_answer).strip().lower()
-            if is_correct:
-                insights["section_analysis"][section]["correct"] += 1
-            
-            # Question type analysis
-            q_type = "MCQ" if "Multiple Choice" in str(question_type) else "TITA"
-            insights["question_type_performance"][q_type]["attempted"] += 1
-            if is_correct:
-                insights["question_type_performance"][q_type]["correct"] += 1
+    # Only attempted questions in a known section are counted
+    attempted = arrays["attempted"] & (section_code >= 0)
+    correct = attempted & arrays["correct"]
+    is_mcq = arrays["is_mcq"]
+    
+    attempted_counts = _per_section(section_code, attempted)
+    correct_counts = _per_section(section_code, correct)
+    time_totals = _per_section(section_code, attempted, arrays["time_spent"])
+    for i, section in enumerate(SECTIONS):
+        data = insights["section_analysis"][section]
+        data["attempted"] = attempted_counts[i]
+        data["correct"] = correct_counts[i]
+        data["total_time"] = time_totals[i]
+    
+    for q_type, type_mask in (("MCQ", is_mcq), ("TITA", ~is_mcq)):
+        insights["question_type_performance"][q_type]["attempted"] = int((attempted & type_mask).sum())
+        insights["question_type_performance"][q_type]["correct"] = int((correct & type_mask).sum())
     
     # Calculate efficiency metrics safely
     for section in insights["section_analysis"]:
@@ -1587,30 +2109,8 @@ def format_time_human(seconds: float) -> str:
 def generate_basic_analysis(section_scores: dict, total_score: int, test_name: str = None) -> str:
     """Generate basic analysis when AI is not available"""
     # Get dynamic question counts
-    test_data = load_test_data()
-    
-    # Find the test data for this specific test
-    current_test = None
-    if test_name:
-        for test in test_data:
-            if test["name"] == test_name:
-                current_test = test
-                break
-    
-    if current_test:
-        varc_count = sum(len(q["qa_list"]) for q in current_test["data"]["VARC"])
-        dilr_count = sum(len(q["qa_list"]) for q in current_test["data"]["DILR"])
-        qa_count = sum(len(q["qa_list"]) for q in current_test["data"]["QA"])
-        section_max = {
-            "VARC": varc_count * 3,
-            "DILR": dilr_count * 3,
-            "QA": qa_count * 3
-        }
-        total_max = sum(section_max.values())
-    else:
-        # Fallback to default values
-        section_max = {"VARC": 72, "DILR": 60, "QA": 66}
-        total_max = 198
+    section_max = section_max_marks(test_name or "")
+    total_max = sum(section_max.values())
     
     # Find best and worst sections
     section_percentages = {k: (v/section_max[k])*100 for k, v in section_scores.items()}
@@ -1664,10 +2164,13 @@ if __name__ == "__main__":
         print("🌐 Network access: Available on all interfaces")
     print("💡 For public access via ngrok, use: python start_with_ngrok.py")
     
+    # loop/http "auto" use uvloop and httptools when installed, asyncio and h11 otherwise
     uvicorn.run(
         "app:app", 
         host=host, 
         port=port, 
         reload=debug,
-        log_level="info" if not debug else "debug"
+        log_level="info" if not debug else "debug",
+        loop="auto",
+        http="auto"
     )